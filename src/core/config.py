@@ -12,7 +12,21 @@ class Settings(BaseSettings):
     DB_PASS: str = os.getenv("DB_PASS")
     DB_NAME: str = os.getenv("DB_NAME")
 
+    # Пул соединений асинхронного движка
+    DB_POOL_SIZE: int = os.getenv("DB_POOL_SIZE", 10)
+    DB_MAX_OVERFLOW: int = os.getenv("DB_MAX_OVERFLOW", 20)
+    DB_POOL_TIMEOUT: int = os.getenv("DB_POOL_TIMEOUT", 30)
+    DB_POOL_RECYCLE: int = os.getenv("DB_POOL_RECYCLE", 1800)  # секунды, меньше wait_timeout MySQL
+    DB_POOL_PRE_PING: bool = os.getenv("DB_POOL_PRE_PING", True)
+
+    # Хранилище файлов: объект без ссылок удаляется не раньше, чем через FILE_ORPHAN_GRACE секунд
+    # после последнего сохранения или поиска; сборка таких объектов — раз в FILE_SWEEP_INTERVAL секунд
+    FILE_ORPHAN_GRACE: int = os.getenv("FILE_ORPHAN_GRACE", 3600)
+    FILE_SWEEP_INTERVAL: int = os.getenv("FILE_SWEEP_INTERVAL", 3600)
+
 settings = Settings()
 
-# Создание строки подключения (DSN)
-DSN = f"mysql+pymysql://{settings.DB_USER}:{settings.DB_PASS}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
+# Создание строки подключения (DSN) для асинхронного драйвера.
+# Драйвер ставится отдельно от SQLAlchemy: pip install aiomysql
+# Схема создается и обновляется командой python -m src.core.migrate
+DSN = f"mysql+aiomysql://{settings.DB_USER}:{settings.DB_PASS}@{settings.DB_HOST}:{settings.DB_PORT}/{settings.DB_NAME}"
@@ -1,16 +1,35 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, DeclarativeBase
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy.orm import DeclarativeBase
 
-from src.core.config import DSN
+from src.core.config import DSN, settings
 
-# Создание движка базы данных
-engine = create_engine(url=DSN)
+# Создание асинхронного движка базы данных
+engine = create_async_engine(
+    url=DSN,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_pre_ping=settings.DB_POOL_PRE_PING,
+)
 
-# Создание сессии
-session_factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Создание сессии; expire_on_commit=False, чтобы ORM-объекты были доступны после закрытия сессии
+session_factory = async_sessionmaker(
+    bind=engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
 
 
 # Базовый класс для моделей
 class Base(DeclarativeBase):
     pass
 
+
+async def create_tables(drop: bool = False) -> None:
+    """Создает (и при необходимости пересоздает) все таблицы."""
+    async with engine.begin() as conn:
+        if drop:
+            await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
@@ -15,6 +15,9 @@ _notion_service = NotionService()
 _telegram_service = TelegramService(_telegram_client)
 _file_util = FileUtil()
 
+# Изменение блоков коллекции сбрасывает закэшированные по ней ответы модели
+_notion_service.add_collection_change_listener(_llm_service.answer_cache.invalidate_collections)
+
 @lru_cache(maxsize=1)
 def get_llm_service() -> LlmService:
     return _llm_service
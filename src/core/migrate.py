@@ -0,0 +1,100 @@
+"""
+Доводит схему существующей базы до текущих моделей: create_all создает только
+новые таблицы и не трогает уже существующие, поэтому новые колонки и уникальный
+индекс на telegram_chat.telegram_chat_id добавляются здесь. Здесь же — разовые
+исправления данных. Повторный запуск безопасен.
+
+Запуск: python -m src.core.migrate
+"""
+import asyncio
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src.core.database import engine, session_factory, create_tables
+from src.llm.mysql import LlmMysql
+# Модели импортируются ради регистрации таблиц в Base.metadata
+import src.core.models  # noqa: F401
+import src.llm.models  # noqa: F401
+import src.notion.models  # noqa: F401
+import src.telegram.models  # noqa: F401
+
+
+# (таблица, колонка, определение)
+NEW_COLUMNS = [
+    ("telegram_chat", "icon_photo_id", "BIGINT NULL"),
+    ("telegram_chat", "mirror_head_id", "BIGINT NULL"),
+    ("telegram_chat", "mirror_tail_id", "BIGINT NULL"),
+    ("telegram_chat", "mirror_complete", "BOOL NOT NULL DEFAULT 0"),
+    ("telegram_message", "is_placeholder", "BOOL NOT NULL DEFAULT 0"),
+    ("stored_file", "touched_at", "DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP"),
+    ("llm_chat", "summary", "TEXT NULL"),
+    ("llm_chat", "summary_until_id", "INTEGER NULL"),
+]
+
+
+async def _column_exists(conn: AsyncConnection, table: str, column: str) -> bool:
+    result = await conn.execute(text(
+        "SELECT COUNT(*) FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = :table AND column_name = :column"
+    ), {"table": table, "column": column})
+    return result.scalar() > 0
+
+
+async def _unique_index_exists(conn: AsyncConnection, table: str, column: str) -> bool:
+    result = await conn.execute(text(
+        "SELECT COUNT(*) FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = :table AND column_name = :column "
+        "AND non_unique = 0 AND seq_in_index = 1"
+    ), {"table": table, "column": column})
+    return result.scalar() > 0
+
+
+async def _deduplicate_telegram_chats(conn: AsyncConnection) -> int:
+    """Оставляет по одной строке на telegram_chat_id (с минимальным id), кэш переносит на нее."""
+    await conn.execute(text(
+        "UPDATE telegram_cache AS cache "
+        "JOIN telegram_chat AS duplicate ON duplicate.id = cache.chat_id "
+        "JOIN (SELECT telegram_chat_id, MIN(id) AS keep_id FROM telegram_chat GROUP BY telegram_chat_id) AS keep "
+        "ON keep.telegram_chat_id = duplicate.telegram_chat_id "
+        "SET cache.chat_id = keep.keep_id "
+        "WHERE duplicate.id <> keep.keep_id"
+    ))
+    # Зеркало сообщений дубликатов не переносим: оно перечитается из Telegram
+    result = await conn.execute(text(
+        "DELETE duplicate FROM telegram_chat AS duplicate "
+        "JOIN (SELECT telegram_chat_id, MIN(id) AS keep_id FROM telegram_chat GROUP BY telegram_chat_id) AS keep "
+        "ON keep.telegram_chat_id = duplicate.telegram_chat_id "
+        "WHERE duplicate.id <> keep.keep_id"
+    ))
+    return result.rowcount
+
+
+async def migrate() -> None:
+    # Новые таблицы (stored_file, telegram_message и т.д.)
+    await create_tables()
+
+    async with engine.begin() as conn:
+        for table, column, definition in NEW_COLUMNS:
+            if await _column_exists(conn, table, column):
+                continue
+            await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {definition}"))
+            print(f"Добавлена колонка {table}.{column}")
+
+        if not await _unique_index_exists(conn, "telegram_chat", "telegram_chat_id"):
+            removed = await _deduplicate_telegram_chats(conn)
+            print(f"Удалено дубликатов telegram_chat: {removed}")
+            await conn.execute(text(
+                "ALTER TABLE telegram_chat ADD UNIQUE INDEX telegram_chat_id (telegram_chat_id)"
+            ))
+            print("Добавлен уникальный индекс telegram_chat.telegram_chat_id")
+
+    # Чатам, созданным до именования при записи, название дается по первому запросу
+    renamed = await LlmMysql(engine=engine, session_factory=session_factory).name_chats_by_first_request()
+    print(f"Переименовано чатов LLM: {renamed}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate())
@@ -0,0 +1,24 @@
+from datetime import datetime
+
+from sqlalchemy import Integer, String, ForeignKey, BigInteger, DateTime, func
+from sqlalchemy.orm import Mapped, mapped_column
+from src.core.database import Base
+
+
+class StoredFileOrm(Base):
+    __tablename__ = "stored_file"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    object_name: Mapped[str] = mapped_column(String(80), unique=True)  # sha256 + расширение
+    size: Mapped[int] = mapped_column(BigInteger)
+    ref_count: Mapped[int] = mapped_column(Integer, default=0)  # блоки, записи кэша и аватары, ссылающиеся на объект
+    # Последнее сохранение или поиск объекта; объект без ссылок удаляется только после срока ожидания
+    touched_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+
+
+class FileSourceOrm(Base):
+    __tablename__ = "stored_file_source"
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    source_key: Mapped[str] = mapped_column(String(255), unique=True)  # например, doc_{id}_{access_hash}
+    stored_file_id: Mapped[int] = mapped_column(Integer, ForeignKey("stored_file.id", ondelete="CASCADE"))
@@ -0,0 +1,147 @@
+from typing import Awaitable, Callable, Optional
+from sqlalchemy import select, update, delete, func, literal_column
+from sqlalchemy.dialects.mysql import insert
+from src.core.models import StoredFileOrm, FileSourceOrm
+
+
+class FileMysql:
+    def __init__(self, engine, session_factory):
+        self.engine = engine
+        self.session_factory = session_factory
+
+    async def get_file_by_source(self, source_key: str) -> Optional[StoredFileOrm]:
+        """Объект, сохраненный из этого источника; продлевает ему срок ожидания первой ссылки."""
+        async with self.session_factory() as session:
+            query = (
+                select(StoredFileOrm)
+                .join(FileSourceOrm, FileSourceOrm.stored_file_id == StoredFileOrm.id)
+                .where(FileSourceOrm.source_key == source_key)
+                .with_for_update()
+            )
+            stored_file = (await session.execute(query)).scalar_one_or_none()
+            if stored_file:
+                await session.execute(
+                    update(StoredFileOrm)
+                    .where(StoredFileOrm.id == stored_file.id)
+                    .values(touched_at=func.now())
+                )
+            await session.commit()
+            return stored_file
+
+    async def register_file(
+            self,
+            object_name: str,
+            size: int,
+            place_file: Callable[[], Awaitable[None]],
+            source_key: Optional[str] = None
+    ) -> StoredFileOrm:
+        """Регистрирует объект в хранилище (без ссылок) и привязывает к нему источник.
+
+        place_file кладет файл на диск, пока строка объекта заблокирована вставкой:
+        параллельные release_file и sweep_unreferenced не удалят его между записью и регистрацией.
+        """
+        async with self.session_factory() as session:
+            upsert_query = (
+                insert(StoredFileOrm)
+                .values(object_name=object_name, size=size, ref_count=0, touched_at=func.now())
+            )
+            upsert_query = upsert_query.on_duplicate_key_update(
+                size=upsert_query.inserted.size,
+                touched_at=upsert_query.inserted.touched_at,
+            )
+            await session.execute(upsert_query)
+            await place_file()
+
+            stored_file = (await session.execute(
+                select(StoredFileOrm).where(StoredFileOrm.object_name == object_name)
+            )).scalar_one()
+
+            if source_key:
+                source_query = (
+                    insert(FileSourceOrm)
+                    .values(source_key=source_key, stored_file_id=stored_file.id)
+                    .prefix_with("IGNORE")
+                )
+                await session.execute(source_query)
+
+            await session.commit()
+            return stored_file
+
+    async def add_file_reference(self, object_name: str) -> bool:
+        """Увеличивает счетчик ссылок; False, если объект не зарегистрирован."""
+        async with self.session_factory() as session:
+            update_query = (
+                update(StoredFileOrm)
+                .where(StoredFileOrm.object_name == object_name)
+                .values(ref_count=StoredFileOrm.ref_count + 1)
+            )
+            result = await session.execute(update_query)
+            await session.commit()
+            return result.rowcount > 0
+
+    async def release_file(
+            self,
+            object_name: str,
+            grace_seconds: int,
+            remove_file: Callable[[str], Awaitable[None]]
+    ) -> bool:
+        """Уменьшает счетчик ссылок; True, если ссылок не осталось и объект удален.
+
+        Счетчик, удаление строки и файла — в одной транзакции под SELECT ... FOR UPDATE.
+        Объект, который сохраняли или искали позже grace_seconds назад, оставляется sweep_unreferenced:
+        его URL мог только что получить новый владелец, еще не взявший ссылку.
+        """
+        async with self.session_factory() as session:
+            query = (
+                select(StoredFileOrm, self._is_expired(grace_seconds))
+                .where(StoredFileOrm.object_name == object_name)
+                .with_for_update()
+            )
+            row = (await session.execute(query)).first()
+            if row is None:
+                return False
+            stored_file, expired = row
+
+            ref_count = max(stored_file.ref_count - 1, 0)
+            removed = ref_count == 0 and bool(expired)
+            if removed:
+                await session.execute(delete(StoredFileOrm).where(StoredFileOrm.id == stored_file.id))
+                await remove_file(object_name)
+            else:
+                await session.execute(
+                    update(StoredFileOrm)
+                    .where(StoredFileOrm.id == stored_file.id)
+                    .values(ref_count=ref_count)
+                )
+            await session.commit()
+            return removed
+
+    async def sweep_unreferenced(
+            self,
+            grace_seconds: int,
+            remove_file: Callable[[str], Awaitable[None]],
+            limit: int = 500
+    ) -> int:
+        """Удаляет объекты без ссылок, которые не сохраняли и не искали дольше grace_seconds."""
+        async with self.session_factory() as session:
+            query = (
+                select(StoredFileOrm)
+                .where(StoredFileOrm.ref_count <= 0, self._is_expired(grace_seconds))
+                .limit(limit)
+                .with_for_update(skip_locked=True)
+            )
+            stored_files = (await session.execute(query)).scalars().all()
+            if not stored_files:
+                return 0
+            await session.execute(
+                delete(StoredFileOrm).where(StoredFileOrm.id.in_([stored_file.id for stored_file in stored_files]))
+            )
+            for stored_file in stored_files:
+                await remove_file(stored_file.object_name)
+            await session.commit()
+            return len(stored_files)
+
+    @staticmethod
+    def _is_expired(grace_seconds: int):
+        # Сравниваем по часам MySQL: touched_at пишет сервер БД
+        return func.timestampdiff(literal_column("SECOND"), StoredFileOrm.touched_at, func.now()) >= grace_seconds
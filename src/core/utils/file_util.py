@@ -1,26 +1,216 @@
 import re
-import uuid
 import os
-from typing import BinaryIO, Optional
+import asyncio
+import hashlib
+import tempfile
+from typing import AsyncIterator, BinaryIO, Optional
 from unstructured.partition.auto import partition
 
+from src.core.config import settings
+from src.core.database import engine, session_factory
+from src.core.mysql import FileMysql
+
+# Размер куска при потоковом копировании и хэшировании файлов
+CHUNK_SIZE = 512 * 1024
+
+# Объекты лежат внутри var/files, чтобы get_file_text находил их по прежнему пути
+OBJECTS_PATH = "files"
+OBJECT_URL_PATTERN = re.compile(r'/var/files/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64}[^/]*)$')
+
 
 class FileUtil:
+    """
+    Хранилище файлов с адресацией по содержимому: объект лежит в
+    {storage_path}files/ab/cd/<sha256><ext>, одинаковые файлы хранятся один раз,
+    а число ссылок на объект ведется в MySQL (таблица stored_file).
+
+    Сохранение ссылку не берет: ее берут владельцы (точка FileBlock, запись кэша Telegram,
+    аватар чата) через acquire_file и снимают через release_file. Объекты, на которые так
+    и не сослались (например, превью блока, который не добавили), собирает фоновая задача.
+    """
+
     def __init__(self, storage_path: str = "/home/parus/Projects/KP/var/"):
         self.storage_path = storage_path
         os.makedirs(self.storage_path, exist_ok=True)
+        self.mysql = FileMysql(engine=engine, session_factory=session_factory)
+        self._sweep_task: Optional[asyncio.Task] = None
+
+    async def save_file(self, file: BinaryIO, filename: Optional[str] = None, source_key: Optional[str] = None) -> tuple[str, str]:
+        """Сохраняет файловый объект (например, загрузку) кусками. Возвращает (name, url)."""
+        tmp_path = self.make_temp_path()
+        try:
+            # Чтение, хэширование и запись — в потоке, чтобы большая загрузка не блокировала event loop
+            digest = await asyncio.to_thread(self._copy_to_temp, file, tmp_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return await self._commit(tmp_path, filename, digest, source_key)
+
+    def make_temp_path(self, suffix: str = "") -> str:
+        """Временный файл в каталоге хранилища (та же ФС, чтобы rename был атомарным)."""
+        directory = f"{self.storage_path}{OBJECTS_PATH}"
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".part_", suffix=suffix)
+        os.close(fd)
+        return tmp_path
+
+    async def save_stream(
+            self,
+            chunks: AsyncIterator[bytes],
+            filename: str,
+            source_key: Optional[str] = None
+    ) -> tuple[str, str]:
+        """
+        Пишет поток чанков во временный файл, считая SHA-256 на лету,
+        и атомарно переносит его в хранилище. Возвращает (name, url).
+        """
+        tmp_path = self.make_temp_path()
+        sha256 = hashlib.sha256()
+        try:
+            with open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    # Запись и хэширование чанка — в потоке, event loop продолжает обслуживать запросы
+                    await asyncio.to_thread(self._write_chunk, f, sha256, chunk)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return await self._commit(tmp_path, filename, sha256.hexdigest(), source_key)
+
+    async def commit_temp_file(self, tmp_path: str, filename: str, source_key: Optional[str] = None) -> tuple[str, str]:
+        """Переносит уже записанный временный файл в хранилище. Возвращает (name, url)."""
+        digest = await asyncio.to_thread(self._hash_file, tmp_path)
+        return await self._commit(tmp_path, filename, digest, source_key)
+
+    @staticmethod
+    def _copy_to_temp(file: BinaryIO, tmp_path: str) -> str:
+        sha256 = hashlib.sha256()
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b""):
+                sha256.update(chunk)
+                f.write(chunk)
+        return sha256.hexdigest()
+
+    @staticmethod
+    def _write_chunk(f: BinaryIO, sha256, chunk: bytes) -> None:
+        sha256.update(chunk)
+        f.write(chunk)
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        sha256 = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                sha256.update(chunk)
+        return sha256.hexdigest()
+
+    async def find_by_source(self, source_key: str) -> Optional[str]:
+        """Проверка до скачивания: URL объекта из этого источника, если он уже сохранен."""
+        stored_file = await self.mysql.get_file_by_source(source_key)
+        if not stored_file or not os.path.exists(self._object_path(stored_file.object_name)):
+            return None
+        return self._object_url(stored_file.object_name)
+
+    async def acquire_file(self, file_url: str) -> None:
+        """Берет ссылку на объект от нового владельца."""
+        match = OBJECT_URL_PATTERN.search(file_url or "")
+        if not match:
+            return  # файл сохранен до перехода на адресацию по содержимому
+        if not await self.mysql.add_file_reference(match.group(1)):
+            raise FileNotFoundError(f"Объект {match.group(1)} не зарегистрирован в хранилище")
 
-    def save_file(self, file: BinaryIO, path: str, filename: Optional[str] = None) -> str:
-        # Пытаемся получить расширение разными способами
+    async def release_file(self, file_url: str) -> None:
+        """Снимает ссылку на объект; файл удаляется, когда ссылок не осталось."""
+        match = OBJECT_URL_PATTERN.search(file_url or "")
+        if not match:
+            return  # файл сохранен до перехода на адресацию по содержимому
+        await self.mysql.release_file(
+            match.group(1),
+            grace_seconds=settings.FILE_ORPHAN_GRACE,
+            remove_file=self._remove_object
+        )
+
+    async def sweep_unreferenced(self) -> int:
+        """Удаляет объекты без ссылок старше срока ожидания. Возвращает число удаленных."""
+        removed = 0
+        while True:
+            count = await self.mysql.sweep_unreferenced(
+                grace_seconds=settings.FILE_ORPHAN_GRACE,
+                remove_file=self._remove_object
+            )
+            removed += count
+            if not count:
+                return removed
+
+    def start_sweep(self) -> None:
+        interval = float(settings.FILE_SWEEP_INTERVAL)
+        if interval <= 0 or self._sweep_task is not None:
+            return
+        self._sweep_task = asyncio.create_task(self._sweep_loop(interval))
+
+    async def stop_sweep(self) -> None:
+        if self._sweep_task is None:
+            return
+        self._sweep_task.cancel()
+        try:
+            await self._sweep_task
+        except asyncio.CancelledError:
+            pass
+        self._sweep_task = None
+
+    async def _sweep_loop(self, interval: float) -> None:
+        while True:
+            try:
+                removed = await self.sweep_unreferenced()
+                if removed:
+                    print(f"[FileUtil] Удалено объектов без ссылок: {removed}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[FileUtil] Ошибка сборки объектов без ссылок: {e}")
+            await asyncio.sleep(interval)
+
+    async def _remove_object(self, object_name: str) -> None:
+        try:
+            await asyncio.to_thread(os.unlink, self._object_path(object_name))
+        except FileNotFoundError:
+            pass
+
+    async def _commit(self, tmp_path: str, filename: str, digest: str, source_key: Optional[str] = None) -> tuple[str, str]:
         name, extension = os.path.splitext(filename)
-        filename = uuid.uuid4()
-        file_path = f"{self.storage_path}{path}/{filename}{extension}"
+        object_name = f"{digest}{extension}"
+        object_path = self._object_path(object_name)
+        size = os.path.getsize(tmp_path)
+
+        def place_file() -> None:
+            if os.path.exists(object_path):
+                os.unlink(tmp_path)  # такой объект уже есть — лишнего места не тратим
+            else:
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                os.replace(tmp_path, object_path)
 
-        with open(file_path, "wb") as f:
-            f.write(file.read())
-        print(f"name = {name}, extension = {extension}")
-        return name, f"http://127.0.0.1:8080/var/{path}/{filename}{extension}"
-    
+        try:
+            await self.mysql.register_file(
+                object_name=object_name,
+                size=size,
+                place_file=lambda: asyncio.to_thread(place_file),
+                source_key=source_key
+            )
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        print(f"name = {name}, object = {object_name}")
+        return name, self._object_url(object_name)
+
+    @staticmethod
+    def _object_relative_path(object_name: str) -> str:
+        return f"{OBJECTS_PATH}/{object_name[:2]}/{object_name[2:4]}/{object_name}"
+
+    def _object_path(self, object_name: str) -> str:
+        return f"{self.storage_path}{self._object_relative_path(object_name)}"
+
+    def _object_url(self, object_name: str) -> str:
+        return f"http://127.0.0.1:8080/var/{self._object_relative_path(object_name)}"
 
     @staticmethod
     def get_file_text(file_path: str) -> str:
@@ -30,4 +220,41 @@ class FileUtil:
             text = "\n".join([str(el) for el in elements])
             return text
         except Exception as e:
-            return f"Ошибка: {str(e)}"
\ No newline at end of file
+            return f"Ошибка: {str(e)}"
+
+    @staticmethod
+    def split_text(text: str, chunk_size: int = 1000, overlap: int = 200) -> list[str]:
+        """Разбивает текст на чанки по границам предложений с перекрытием."""
+        sentences = [s for s in re.split(r'(?<=[.!?…])\s+|\n{2,}', text) if s and s.strip()]
+
+        # Предложения длиннее чанка режем жестко
+        step = max(chunk_size - overlap, 1)
+        pieces = []
+        for sentence in sentences:
+            sentence = sentence.strip()
+            if len(sentence) <= chunk_size:
+                pieces.append(sentence)
+            else:
+                pieces.extend(sentence[i:i + chunk_size] for i in range(0, len(sentence), step))
+
+        chunks = []
+        current = []
+        current_len = 0
+        for piece in pieces:
+            if current and current_len + len(piece) + 1 > chunk_size:
+                chunks.append(" ".join(current))
+                # Перекрытие: переносим хвостовые предложения в следующий чанк
+                tail = []
+                tail_len = 0
+                for prev in reversed(current):
+                    if tail_len + len(prev) + 1 > overlap:
+                        break
+                    tail.insert(0, prev)
+                    tail_len += len(prev) + 1
+                current = tail
+                current_len = tail_len
+            current.append(piece)
+            current_len += len(piece) + 1
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
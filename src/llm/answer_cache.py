@@ -0,0 +1,103 @@
+import hashlib
+import itertools
+import json
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+
+class SemanticAnswerCache:
+    """LRU-кэш ответов модели: совпадение по смыслу вопроса в пределах одного набора коллекций.
+
+    Ключ — вектор вопроса и отпечаток коллекций чата вместе с версиями их содержимого,
+    поэтому после изменения коллекции старые ответы перестают находиться сами собой;
+    invalidate_collections дополнительно освобождает память сразу.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, threshold: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: OrderedDict[int, dict] = OrderedDict()  # порядок — от давно использованных к свежим
+        self._by_fingerprint: Dict[str, Set[int]] = {}
+        self._ids = itertools.count()
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def fingerprint(collection_versions: Dict[str, int]) -> str:
+        raw = json.dumps(sorted(collection_versions.items()))
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, fingerprint: str, vector: List[float]) -> Optional[dict]:
+        """Самый похожий ответ с тем же отпечатком, если сходство не ниже порога."""
+        query = self._normalize(vector)
+        now = time.monotonic()
+        best_key, best_score = None, self.threshold
+        for key in list(self._by_fingerprint.get(fingerprint, ())):
+            entry = self._entries[key]
+            if entry["expires_at"] <= now:
+                self._remove(key)
+                continue
+            score = float(np.dot(query, entry["vector"]))
+            if score >= best_score:
+                best_key, best_score = key, score
+
+        if best_key is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(best_key)
+        return {**self._entries[best_key]["answer"], "similarity": round(best_score, 4)}
+
+    def set(self, fingerprint: str, collection_names: Iterable[str], vector: List[float], answer: dict):
+        key = next(self._ids)
+        self._entries[key] = {
+            "fingerprint": fingerprint,
+            "collections": set(collection_names),
+            "vector": self._normalize(vector),
+            "answer": answer,
+            "expires_at": time.monotonic() + self.ttl,
+        }
+        self._by_fingerprint.setdefault(fingerprint, set()).add(key)
+        while len(self._entries) > self.maxsize:
+            self._remove(next(iter(self._entries)))
+
+    def invalidate_collections(self, collection_names: Iterable[str]):
+        names = set(collection_names)
+        stale = [key for key, entry in self._entries.items() if entry["collections"] & names]
+        for key in stale:
+            self._remove(key)
+        self.invalidated += len(stale)
+
+    def clear(self):
+        self._entries.clear()
+        self._by_fingerprint.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidated": self.invalidated,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+    def _remove(self, key: int):
+        entry = self._entries.pop(key)
+        keys = self._by_fingerprint.get(entry["fingerprint"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_fingerprint[entry["fingerprint"]]
+
+    @staticmethod
+    def _normalize(vector: List[float]) -> np.ndarray:
+        array = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(array)
+        return array / norm if norm else array
@@ -0,0 +1,35 @@
+from pydantic_settings import BaseSettings
+
+from dotenv import load_dotenv
+import os
+
+load_dotenv()  # Загрузка переменных из файла .env
+
+class LlmSettings(BaseSettings):
+    OP_KEY: str = os.getenv("OP_KEY", "")
+    LLM_BASE_URL: str = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
+    LLM_MODEL: str = os.getenv("LLM_MODEL", "nvidia/nemotron-nano-9b-v2:free")
+
+    # Таймауты запроса к модели (секунды): общий на ответ и на ожидание очередного чанка
+    LLM_TIMEOUT: float = os.getenv("LLM_TIMEOUT", 120)
+    LLM_READ_TIMEOUT: float = os.getenv("LLM_READ_TIMEOUT", 30)
+
+    # Бюджет контекста промпта (токены)
+    LLM_CONTEXT_BUDGET: int = os.getenv("LLM_CONTEXT_BUDGET", 6000)
+    LLM_QUESTION_MAX_TOKENS: int = os.getenv("LLM_QUESTION_MAX_TOKENS", 1000)
+    LLM_HISTORY_SHARE: float = os.getenv("LLM_HISTORY_SHARE", 0.3)  # доля бюджета под историю чата
+    LLM_CHUNK_DEDUP_THRESHOLD: float = os.getenv("LLM_CHUNK_DEDUP_THRESHOLD", 0.85)  # сходство шинглов
+    LLM_TOKENIZER_ENCODING: str = os.getenv("LLM_TOKENIZER_ENCODING", "cl100k_base")
+
+    # Сжатие длинной истории: в промпт идут сводка и все еще не свернутые в нее запросы;
+    # сворачиваются те, что старше последних LLM_HISTORY_TURNS, пачками от LLM_SUMMARY_BATCH
+    LLM_HISTORY_TURNS: int = os.getenv("LLM_HISTORY_TURNS", 6)
+    LLM_SUMMARY_BATCH: int = os.getenv("LLM_SUMMARY_BATCH", 6)  # сколько запросов копится сверх окна до пересчета
+    LLM_SUMMARY_MAX_TOKENS: int = os.getenv("LLM_SUMMARY_MAX_TOKENS", 500)
+
+    # Семантический кэш ответов
+    ANSWER_CACHE_SIZE: int = os.getenv("ANSWER_CACHE_SIZE", 1000)
+    ANSWER_CACHE_TTL: float = os.getenv("ANSWER_CACHE_TTL", 86400)  # секунды
+    ANSWER_CACHE_THRESHOLD: float = os.getenv("ANSWER_CACHE_THRESHOLD", 0.95)  # косинусное сходство вопросов
+
+llm_settings = LlmSettings()
@@ -0,0 +1,136 @@
+import re
+
+from src.llm.schemes import PackedContext
+
+try:
+    import tiktoken
+except ImportError:  # без tiktoken считаем токены приближенно
+    tiktoken = None
+
+
+CHARS_PER_TOKEN = 4  # оценка для приближенного подсчета
+SHINGLE_SIZE = 3     # слов в шингле при поиске почти-дубликатов
+
+
+class ContextPacker:
+    """Собирает контекст запроса к модели в пределах бюджета токенов.
+
+    Бюджет делится так: вопрос (не больше question_max_tokens), история (доля history_share
+    от остатка, с самых новых реплик), все остальное — найденные чанки в порядке score.
+    Неиспользованный бюджет чанков возвращается истории.
+    """
+
+    def __init__(
+        self,
+        budget: int,
+        question_max_tokens: int,
+        history_share: float,
+        dedup_threshold: float,
+        encoding_name: str
+    ):
+        self.budget = budget
+        self.question_max_tokens = question_max_tokens
+        self.history_share = history_share
+        self.dedup_threshold = dedup_threshold
+        self.encoding = tiktoken.get_encoding(encoding_name) if tiktoken else None
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding is not None:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Обрезает текст до max_tokens, по возможности на границе предложения или слова."""
+        if self.count(text) <= max_tokens:
+            return text
+        if max_tokens <= 1:
+            return ""
+        limit = max_tokens - 1  # один токен оставляем под многоточие
+        if self.encoding is not None:
+            cut = self.encoding.decode(self.encoding.encode(text, disallowed_special=())[:limit])
+        else:
+            cut = text[:limit * CHARS_PER_TOKEN]
+
+        boundary = max(cut.rfind(". "), cut.rfind("\n"))
+        if boundary < len(cut) // 2:
+            boundary = cut.rfind(" ")
+        if boundary >= len(cut) // 2:
+            cut = cut[:boundary + 1]
+        return cut.rstrip() + "…"
+
+    def pack(self, question: str, history: list[str], chunks: list[dict], reserved_tokens: int = 0) -> PackedContext:
+        """history — реплики от старых к новым, chunks — {"text", "score"} из поиска."""
+        question = self.truncate(question, self.question_max_tokens)
+        question_tokens = self.count(question)
+        remaining = max(self.budget - reserved_tokens - question_tokens, 0)
+
+        # История: сначала гарантированная доля, самые новые реплики целиком
+        turn_tokens = [self.count(turn) for turn in history]
+        history_start, history_tokens = self._take_recent(turn_tokens, len(history), int(remaining * self.history_share))
+
+        # Чанки: по убыванию score, без почти-дубликатов; последний помещающийся обрезаем
+        chunk_budget = remaining - history_tokens
+        selected_chunks, selected_shingles = [], []
+        chunks_tokens = 0
+        for chunk in sorted(chunks, key=lambda chunk: chunk.get("score", 0), reverse=True):
+            text = (chunk.get("text") or "").strip()
+            if not text:
+                continue
+            shingles = self._shingles(text)
+            if any(self._similarity(shingles, other) >= self.dedup_threshold for other in selected_shingles):
+                continue
+            tokens = self.count(text)
+            if chunks_tokens + tokens > chunk_budget:
+                text = self.truncate(text, chunk_budget - chunks_tokens)
+                if text:
+                    selected_chunks.append(text)
+                    chunks_tokens += self.count(text)
+                break
+            selected_chunks.append(text)
+            selected_shingles.append(shingles)
+            chunks_tokens += tokens
+
+        # Остаток бюджета отдаем более старым репликам
+        history_start, extra_tokens = self._take_recent(
+            turn_tokens, history_start, remaining - history_tokens - chunks_tokens
+        )
+        history_tokens += extra_tokens
+
+        return PackedContext(
+            question=question,
+            history=history[history_start:],
+            chunks=selected_chunks,
+            question_tokens=question_tokens,
+            history_tokens=history_tokens,
+            chunks_tokens=chunks_tokens,
+            reserved_tokens=reserved_tokens,
+            total_tokens=reserved_tokens + question_tokens + history_tokens + chunks_tokens,
+            budget=self.budget,
+            dropped_turns=history_start,
+            dropped_chunks=len(chunks) - len(selected_chunks),
+        )
+
+    @staticmethod
+    def _take_recent(turn_tokens: list[int], end: int, budget: int) -> tuple[int, int]:
+        """Берет реплики с end-1 назад, пока они целиком помещаются в budget."""
+        start, used = end, 0
+        while start > 0 and used + turn_tokens[start - 1] <= budget:
+            start -= 1
+            used += turn_tokens[start]
+        return start, used
+
+    @staticmethod
+    def _shingles(text: str) -> set:
+        words = re.findall(r"\w+", text.lower())
+        if len(words) <= SHINGLE_SIZE:
+            return {tuple(words)}
+        return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+    @staticmethod
+    def _similarity(first: set, second: set) -> float:
+        if not first or not second:
+            return 0.0
+        return len(first & second) / len(first | second)
+
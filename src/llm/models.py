@@ -4,11 +4,18 @@ from sqlalchemy.orm import Mapped, mapped_column
 from src.core.database import Base
 
 
+DEFAULT_CHAT_NAME = "New chat"
+CHAT_NAME_LENGTH = 100  # длина названия, которое берется из первого запроса
+
+
 class LlmChatOrm(Base):
     __tablename__ = "llm_chat"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    name: Mapped[str] = mapped_column(String(200), default="New chat")
+    name: Mapped[str] = mapped_column(String(200), default=DEFAULT_CHAT_NAME)
+    # Сжатая история: все запросы с id <= summary_until_id уже свернуты в summary
+    summary: Mapped[str] = mapped_column(Text, nullable=True)
+    summary_until_id: Mapped[int] = mapped_column(Integer, nullable=True)
 
 class RequestResponseOrm(Base):
     __tablename__ = "request_response"
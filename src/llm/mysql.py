@@ -1,6 +1,6 @@
-from sqlalchemy import select
+from sqlalchemy import select, delete, update, func, exists
 
-from src.llm.models import LlmChatOrm, RequestResponseOrm, ChatContextOrm
+from src.llm.models import LlmChatOrm, RequestResponseOrm, ChatContextOrm, DEFAULT_CHAT_NAME, CHAT_NAME_LENGTH
 from src.notion.models import NotionCollectionOrm
 
 
@@ -11,26 +11,26 @@ class LlmMysql:
 
 
     #LLM Chats
-    def add_chat(self) -> LlmChatOrm:
-        with self.session_factory() as session:
+    async def add_chat(self) -> LlmChatOrm:
+        async with self.session_factory() as session:
             chat = LlmChatOrm()
             session.add(chat)
-            session.commit()
-            session.refresh(chat)
+            await session.commit()
+            await session.refresh(chat)
             return chat
 
-    def delete_chat(self, chat_id: int) -> bool:
-        with self.session_factory() as session:
-            chat = session.get(LlmChatOrm, chat_id)
+    async def delete_chat(self, chat_id: int) -> bool:
+        async with self.session_factory() as session:
+            chat = await session.get(LlmChatOrm, chat_id)
             if chat:
-                session.delete(chat)
-                session.commit()
+                await session.delete(chat)
+                await session.commit()
                 return True
             else:
                 return False
 
-    def get_all_chats(self) -> list[LlmChatOrm]:
-        with self.session_factory() as session:
+    async def get_all_chats(self) -> list[LlmChatOrm]:
+        async with self.session_factory() as session:
             query = (
                 select(
                     LlmChatOrm
@@ -39,38 +39,79 @@ class LlmMysql:
                     LlmChatOrm
                 )
             )
-            result = session.execute(query)
+            result = await session.execute(query)
             return result.scalars().all()
 
-    def get_chat_by_id(self, chat_id: int) -> LlmChatOrm | None:
-        with self.session_factory() as session:
-            chat = session.get(LlmChatOrm, chat_id)
+    async def get_chats_page(self, limit: int, before_id: int | None = None) -> list[dict]:
+        """Страница чатов от новых к старым (по первичному ключу), только id и название."""
+        async with self.session_factory() as session:
+            query = select(LlmChatOrm.id, LlmChatOrm.name)
+            if before_id is not None:
+                query = query.where(LlmChatOrm.id < before_id)
+            query = query.order_by(LlmChatOrm.id.desc()).limit(limit)
+            result = await session.execute(query)
+            return [dict(row._mapping) for row in result]
+
+    async def set_default_chat_name(self, chat_id: int, new_name: str) -> None:
+        """Переименовывает чат, только если у него еще название по умолчанию."""
+        async with self.session_factory() as session:
+            await session.execute(
+                update(LlmChatOrm)
+                .where(LlmChatOrm.id == chat_id, LlmChatOrm.name == DEFAULT_CHAT_NAME)
+                .values(name=new_name[:CHAT_NAME_LENGTH])
+            )
+            await session.commit()
+
+    async def name_chats_by_first_request(self) -> int:
+        """Одним запросом дает название чатам, созданным до именования при записи."""
+        async with self.session_factory() as session:
+            first_request = (
+                select(func.left(RequestResponseOrm.request_content, CHAT_NAME_LENGTH))
+                .where(RequestResponseOrm.chat_id == LlmChatOrm.id)
+                .order_by(RequestResponseOrm.id)
+                .limit(1)
+                .scalar_subquery()
+            )
+            result = await session.execute(
+                update(LlmChatOrm)
+                .where(
+                    LlmChatOrm.name == DEFAULT_CHAT_NAME,
+                    exists().where(RequestResponseOrm.chat_id == LlmChatOrm.id)
+                )
+                .values(name=first_request)
+            )
+            await session.commit()
+            return result.rowcount
+
+    async def get_chat_by_id(self, chat_id: int) -> LlmChatOrm | None:
+        async with self.session_factory() as session:
+            chat = await session.get(LlmChatOrm, chat_id)
             return chat
 
-    def update_chat_name(self, chat_id: int, new_name: str) -> LlmChatOrm | None:
-        with self.session_factory() as session:
-            chat = session.get(LlmChatOrm, chat_id)
+    async def update_chat_name(self, chat_id: int, new_name: str) -> LlmChatOrm | None:
+        async with self.session_factory() as session:
+            chat = await session.get(LlmChatOrm, chat_id)
 
             if chat:
                 chat.name = new_name
-                session.commit()
+                await session.commit()
                 return chat
             else:
                 return None
 
 
     #request_responses
-    def add_request_response(self, chat_id: int, request_content: str, response_content: str, documents: list = []) -> RequestResponseOrm:
-        with self.session_factory() as session:
+    async def add_request_response(self, chat_id: int, request_content: str, response_content: str, documents: list = []) -> RequestResponseOrm:
+        async with self.session_factory() as session:
             request_response = RequestResponseOrm(chat_id=chat_id, request_content=request_content,
                                                   response_content=response_content, documents=documents)
             session.add(request_response)
-            session.commit()
-            session.refresh(request_response)
+            await session.commit()
+            await session.refresh(request_response)
             return request_response
 
-    def get_all_request_responses_by_chat_id(self, chat_id: int) -> list[RequestResponseOrm]:
-        with self.session_factory() as session:
+    async def get_all_request_responses_by_chat_id(self, chat_id: int) -> list[RequestResponseOrm]:
+        async with self.session_factory() as session:
             query = (
                 select(
                     RequestResponseOrm
@@ -80,44 +121,80 @@ class LlmMysql:
                 )
                 .where(RequestResponseOrm.chat_id == chat_id)
             )
-            result = session.execute(query)
+            result = await session.execute(query)
             return result.scalars().all()
 
+    async def get_recent_request_responses(self, chat_id: int, limit: int, after_id: int | None = None) -> list[RequestResponseOrm]:
+        """Последние limit запросов чата (новее after_id), от старых к новым."""
+        async with self.session_factory() as session:
+            query = select(RequestResponseOrm).where(RequestResponseOrm.chat_id == chat_id)
+            if after_id is not None:
+                query = query.where(RequestResponseOrm.id > after_id)
+            query = query.order_by(RequestResponseOrm.id.desc()).limit(limit)
+            result = await session.execute(query)
+            return list(reversed(result.scalars().all()))
+
+    async def get_request_responses_after(self, chat_id: int, after_id: int | None, limit: int) -> list[RequestResponseOrm]:
+        """Первые limit запросов чата новее after_id, от старых к новым."""
+        async with self.session_factory() as session:
+            query = select(RequestResponseOrm).where(RequestResponseOrm.chat_id == chat_id)
+            if after_id is not None:
+                query = query.where(RequestResponseOrm.id > after_id)
+            query = query.order_by(RequestResponseOrm.id).limit(limit)
+            result = await session.execute(query)
+            return result.scalars().all()
+
+    async def count_request_responses_after(self, chat_id: int, after_id: int | None) -> int:
+        async with self.session_factory() as session:
+            query = select(func.count(RequestResponseOrm.id)).where(RequestResponseOrm.chat_id == chat_id)
+            if after_id is not None:
+                query = query.where(RequestResponseOrm.id > after_id)
+            return (await session.execute(query)).scalar_one()
+
+    async def update_chat_summary(self, chat_id: int, summary: str, summary_until_id: int) -> None:
+        async with self.session_factory() as session:
+            await session.execute(
+                update(LlmChatOrm)
+                .where(LlmChatOrm.id == chat_id)
+                .values(summary=summary, summary_until_id=summary_until_id)
+            )
+            await session.commit()
+
     #collection
 
 
-    def add_chat_collection_by_qdrant_id(self, chat_id: int, qdrant_collection_id: int) -> int:
-        with self.session_factory() as session:
+    async def add_chat_collection_by_qdrant_id(self, chat_id: int, qdrant_collection_id: int) -> int:
+        async with self.session_factory() as session:
             chat_collection = ChatContextOrm(
                 chat_id=chat_id,
                 qdrant_collection_id=qdrant_collection_id
             )
             session.add(chat_collection)
-            session.commit()
+            await session.commit()
             
             return qdrant_collection_id 
 
-    def get_qdrant_collections_by_chat_id(self, chat_id: int) -> list[NotionCollectionOrm]:
-        with self.session_factory() as session:
+    async def get_qdrant_collections_by_chat_id(self, chat_id: int) -> list[NotionCollectionOrm]:
+        async with self.session_factory() as session:
             query = (
                 select(NotionCollectionOrm)
                 .select_from(NotionCollectionOrm)
                 .join(ChatContextOrm, NotionCollectionOrm.id == ChatContextOrm.qdrant_collection_id)
                 .where(ChatContextOrm.chat_id == chat_id)
             )
-            result = session.execute(query)
+            result = await session.execute(query)
             return result.scalars().all()
         
-    def delete_chat_collection(self, chat_id: int, qdrant_collection_id: int) -> bool:
-        with self.session_factory() as session:
-            result = (
-                session.query(ChatContextOrm)
-                .filter(
+    async def delete_chat_collection(self, chat_id: int, qdrant_collection_id: int) -> bool:
+        async with self.session_factory() as session:
+            query = (
+                delete(ChatContextOrm)
+                .where(
                     ChatContextOrm.chat_id == chat_id,
                     ChatContextOrm.qdrant_collection_id == qdrant_collection_id
                 )
-                .delete()
             )
-            session.commit()
+            result = await session.execute(query)
+            await session.commit()
             
-            return result > 0
\ No newline at end of file
+            return result.rowcount > 0
\ No newline at end of file
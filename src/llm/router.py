@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+from fastapi import APIRouter, HTTPException, Depends, Query, Request
+from fastapi.responses import StreamingResponse
 from src.core.dependencies import get_llm_service, get_notion_service
 from src.llm.schemes import AddNotionContextScheme
 from src.llm.service import LlmService
@@ -11,29 +12,24 @@ router = APIRouter(tags=["llm"])
 
 @router.post("/llm/chats")
 async def create_chat(llm_service: LlmService = Depends(get_llm_service)):
-    return llm_service.create_chat()
+    return await llm_service.create_chat()
 
 @router.delete("/llm/chats/{chat_id}")
 async def delete_chat(chat_id: int, llm_service: LlmService = Depends(get_llm_service)):
-    llm_service.delete_chat(chat_id=chat_id)
+    await llm_service.delete_chat(chat_id=chat_id)
     return {"message": "chat deleted"}
 
 @router.get("/llm/chats")
-async def get_user_chats(llm_service: LlmService = Depends(get_llm_service)):
-    chats = llm_service.get_user_chats()
-    name_changed = False
-    for chat in chats:
-        chat_history = llm_service.get_chat_history(chat_id=chat.id)
-        if chat.name == "New chat" and len(chat_history) >= 1:
-            llm_service.mysql.update_chat_name(chat_id=chat.id, new_name=chat_history[0].request_content[:100])
-            name_changed = True
-    if name_changed:
-        chats = llm_service.get_user_chats()       
-    return chats
+async def get_user_chats(
+    limit: int = Query(default=200, ge=1, le=500),
+    before_id: int | None = Query(default=None),  # id последнего чата предыдущей страницы
+    llm_service: LlmService = Depends(get_llm_service)
+):
+    return await llm_service.get_user_chats(limit=limit, before_id=before_id)
 
 @router.get("/llm/chats/{chat_id}/history")
 async def get_chat_history(chat_id: int, llm_service: LlmService = Depends(get_llm_service)):
-    chat_history = llm_service.get_chat_history(chat_id=chat_id)
+    chat_history = await llm_service.get_chat_history(chat_id=chat_id)
     return chat_history
 
 
@@ -45,7 +41,7 @@ async def add_collection_context_to_chat(
     llm_service: LlmService = Depends(get_llm_service)
 ):
     
-    return llm_service.add_collection_context_to_chat(
+    return await llm_service.add_collection_context_to_chat(
         chat_id=chat_id,
         collection_id=collection_id
     )
@@ -58,9 +54,9 @@ async def add_tag_context_to_chat(
     notion_service: NotionService = Depends(get_notion_service)
 ):
     
-    collections = notion_service.mysql.get_collections_by_tag_id(tag_id=tag_id)
+    collections = await notion_service.mysql.get_collections_by_tag_id(tag_id=tag_id)
     for collection in collections:
-        llm_service.add_collection_context_to_chat(chat_id=chat_id, collection_id=collection.id)
+        await llm_service.add_collection_context_to_chat(chat_id=chat_id, collection_id=collection.id)
 
     return True
 
@@ -69,7 +65,7 @@ async def get_collection_context_from_chat(
     chat_id: int,
     llm_service: LlmService = Depends(get_llm_service)
 ):
-    return llm_service.get_collection_context_from_chat(chat_id=chat_id)
+    return await llm_service.get_collection_context_from_chat(chat_id=chat_id)
 
 @router.delete("/llm/chats/{chat_id}/context/{collection_id}")
 async def get_collection_context_from_chat(
@@ -77,7 +73,7 @@ async def get_collection_context_from_chat(
     collection_id: int,
     llm_service: LlmService = Depends(get_llm_service)
 ):
-    return llm_service.delete_collection_context_from_chat(chat_id=chat_id, qdrant_collection_id=collection_id)
+    return await llm_service.delete_collection_context_from_chat(chat_id=chat_id, qdrant_collection_id=collection_id)
 
 @router.get("/llm/chats/{chat_id}/search")
 async def search_in_llm(
@@ -88,11 +84,63 @@ async def search_in_llm(
 ):
 
     collection_names = []
-    collections = llm_service.get_collection_context_from_chat(chat_id=chat_id)
+    collections = await llm_service.get_collection_context_from_chat(chat_id=chat_id)
     for collection in collections:
         collection_names.append(collection.qdrant_collection_name)
-    qdrant_context, documents = await notion_service.search_in_notion(request, collection_names)
-    llm_response = llm_service.search_in_llm(request=request, chat_id=chat_id, qdrant_context=qdrant_context)
-    llm_service.mysql.add_request_response(chat_id=chat_id, request_content=request, response_content=llm_response, documents=documents)
+
+    # Тот же (по смыслу) вопрос к тем же версиям коллекций — отвечаем из кэша
+    fingerprint = llm_service.answer_cache.fingerprint(notion_service.get_collection_versions(collection_names))
+    query_vector = await notion_service.encode_query(request)
+    cached = llm_service.answer_cache.get(fingerprint, query_vector)
+    if cached is not None:
+        await llm_service.save_request_response(chat_id=chat_id, request=request, response=cached["response"], documents=cached["documents"])
+        return {**cached, "from_cache": True}
+
+    chunks, documents = await notion_service.search_in_notion(request, collection_names)
+    llm_response, usage = await llm_service.search_in_llm(request=request, chat_id=chat_id, chunks=chunks)
+    await llm_service.save_request_response(chat_id=chat_id, request=request, response=llm_response, documents=documents)
+    llm_service.answer_cache.set(
+        fingerprint, collection_names, query_vector,
+        {"response": llm_response, "documents": documents, "usage": usage}
+    )
     
-    return {"response" : llm_response, "documents": documents}
+    return {"response" : llm_response, "documents": documents, "usage": usage, "from_cache": False}
+
+@router.get("/llm/chats/{chat_id}/search/stream")
+async def stream_search_in_llm(
+    chat_id: int,
+    request: str,
+    http_request: Request,
+    llm_service: LlmService = Depends(get_llm_service),
+    notion_service: NotionService = Depends(get_notion_service)
+):
+    collections = await llm_service.get_collection_context_from_chat(chat_id=chat_id)
+    collection_names = [collection.qdrant_collection_name for collection in collections]
+
+    fingerprint = llm_service.answer_cache.fingerprint(notion_service.get_collection_versions(collection_names))
+    query_vector = await notion_service.encode_query(request)
+    cached = llm_service.answer_cache.get(fingerprint, query_vector)
+    if cached is not None:
+        events = await llm_service.stream_cached_answer(request=request, chat_id=chat_id, cached=cached)
+    else:
+        chunks, documents = await notion_service.search_in_notion(request, collection_names)
+        events = await llm_service.stream_search_in_llm(
+            request=request,
+            chat_id=chat_id,
+            chunks=chunks,
+            documents=documents,
+            is_disconnected=http_request.is_disconnected,
+            on_complete=lambda response, usage: llm_service.answer_cache.set(
+                fingerprint, collection_names, query_vector,
+                {"response": response, "documents": documents, "usage": usage}
+            )
+        )
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.get("/llm/answers/cache/stats")
+async def get_answer_cache_stats(llm_service: LlmService = Depends(get_llm_service)):
+    return llm_service.answer_cache.stats()
@@ -2,4 +2,22 @@ from pydantic import BaseModel
 
 class AddNotionContextScheme(BaseModel):
     chat_id: int
-    collection_id: int
\ No newline at end of file
+    collection_id: int
+
+
+class PackedContext(BaseModel):
+    """Контекст запроса к модели, уложенный в бюджет токенов."""
+    question: str
+    history: list[str]
+    chunks: list[str]
+    question_tokens: int
+    history_tokens: int
+    chunks_tokens: int
+    reserved_tokens: int  # служебные инструкции промпта
+    total_tokens: int
+    budget: int
+    dropped_turns: int
+    dropped_chunks: int
+
+    def token_usage(self) -> dict:
+        return self.model_dump(exclude={"question", "history", "chunks"})
@@ -1,92 +1,276 @@
-import os
-from typing import List, Dict
-from openai import OpenAI
+import asyncio
+import json
+from typing import List, Dict, Optional, AsyncIterator, Awaitable, Callable
+import httpx
+from openai import AsyncOpenAI, APIError, APITimeoutError
 from src.core.utils.file_util import FileUtil
+from src.llm.answer_cache import SemanticAnswerCache
+from src.llm.config import llm_settings
+from src.llm.context_packer import ContextPacker
 from src.llm.models import RequestResponseOrm, LlmChatOrm
 from src.llm.mysql import LlmMysql
-from src.llm.schemes import AddNotionContextScheme
+from src.llm.schemes import AddNotionContextScheme, PackedContext
 from src.notion.models import NotionCollectionOrm
 from src.core.database import engine, session_factory
 
 
+PROMPT_INSTRUCTIONS = "Примечание, отвечай строго по контексту!!!"
+SUMMARY_INSTRUCTIONS = (
+    "Обнови краткую сводку диалога пользователя с ассистентом. Сохрани факты, решения, "
+    "договоренности и открытые вопросы, без повторов и вступлений. Ответь только новой сводкой."
+)
+
+
 class LlmService:
     def __init__(self):
         self.mysql = LlmMysql(engine=engine, session_factory=session_factory)
         self.file_util = FileUtil()
-        self.client = OpenAI(base_url="https://openrouter.ai/api/v1",
-                             api_key=os.getenv("OP_KEY"),)
+        self.client = AsyncOpenAI(
+            base_url=llm_settings.LLM_BASE_URL,
+            api_key=llm_settings.OP_KEY,
+            timeout=httpx.Timeout(llm_settings.LLM_TIMEOUT, read=llm_settings.LLM_READ_TIMEOUT),
+        )
+        self.context_packer = ContextPacker(
+            budget=llm_settings.LLM_CONTEXT_BUDGET,
+            question_max_tokens=llm_settings.LLM_QUESTION_MAX_TOKENS,
+            history_share=llm_settings.LLM_HISTORY_SHARE,
+            dedup_threshold=llm_settings.LLM_CHUNK_DEDUP_THRESHOLD,
+            encoding_name=llm_settings.LLM_TOKENIZER_ENCODING
+        )
+        self.answer_cache = SemanticAnswerCache(
+            maxsize=llm_settings.ANSWER_CACHE_SIZE,
+            ttl=llm_settings.ANSWER_CACHE_TTL,
+            threshold=llm_settings.ANSWER_CACHE_THRESHOLD
+        )
+        self._summary_tasks: Dict[int, asyncio.Task] = {}  # chat_id -> фоновое обновление сводки
 
 
 
 
-    def create_chat(self) -> LlmChatOrm:
-        return self.mysql.add_chat()
+    async def create_chat(self) -> LlmChatOrm:
+        return await self.mysql.add_chat()
 
-    def delete_chat(self, chat_id: int) -> bool:
-        return self.mysql.delete_chat(chat_id=chat_id)
+    async def delete_chat(self, chat_id: int) -> bool:
+        return await self.mysql.delete_chat(chat_id=chat_id)
 
-    def get_user_chats(self) -> List[LlmChatOrm]:
-        return self.mysql.get_all_chats()
+    async def get_user_chats(self, limit: int, before_id: Optional[int] = None) -> list[dict]:
+        return await self.mysql.get_chats_page(limit=limit, before_id=before_id)
 
-    def get_chat_history(self, chat_id: int) -> list[RequestResponseOrm]:
-        return self.mysql.get_all_request_responses_by_chat_id(chat_id=chat_id)
+    async def get_chat_history(self, chat_id: int) -> list[RequestResponseOrm]:
+        return await self.mysql.get_all_request_responses_by_chat_id(chat_id=chat_id)
 
-    def add_collection_context_to_chat(self, chat_id, collection_id) -> list[int]:
-        return self.mysql.add_chat_collection_by_qdrant_id(chat_id=chat_id, qdrant_collection_id=collection_id)
+    async def add_collection_context_to_chat(self, chat_id, collection_id) -> list[int]:
+        return await self.mysql.add_chat_collection_by_qdrant_id(chat_id=chat_id, qdrant_collection_id=collection_id)
 
-    def get_collection_context_from_chat(self, chat_id: int) -> list[NotionCollectionOrm]:
-        return self.mysql.get_qdrant_collections_by_chat_id(chat_id=chat_id)
+    async def get_collection_context_from_chat(self, chat_id: int) -> list[NotionCollectionOrm]:
+        return await self.mysql.get_qdrant_collections_by_chat_id(chat_id=chat_id)
     
-    def delete_collection_context_from_chat(self, chat_id: int, qdrant_collection_id: int) -> bool:
-         return self.mysql.delete_chat_collection(chat_id=chat_id, qdrant_collection_id=qdrant_collection_id)
-
-    def search_in_llm(self, request: str, chat_id: int, qdrant_context: str) -> Dict:
-        chat_history = self.get_chat_history(chat_id=chat_id)
-        chat_context = self._get_text_from_chat(chat_history)
-
+    async def delete_collection_context_from_chat(self, chat_id: int, qdrant_collection_id: int) -> bool:
+         return await self.mysql.delete_chat_collection(chat_id=chat_id, qdrant_collection_id=qdrant_collection_id)
 
-
-        completion = self.client.chat.completions.create(
+    async def search_in_llm(self, request: str, chat_id: int, chunks: list[dict]) -> tuple[str, dict]:
+        """Ответ модели и использованные токены контекста."""
+        messages, packed = await self._build_messages(request=request, chat_id=chat_id, chunks=chunks)
+        completion = await self.client.chat.completions.create(
             extra_headers={},
             extra_body={},
-            model="nvidia/nemotron-nano-9b-v2:free",
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "text",
-                            "text": f"Вот мой вопрос: {request}"
-                        },
-                        {
-                            "type": "text",
-                            "text": f"Вот история чата: {chat_context}"
-                        },
-                        {
-                            "type": "text",
-                            "text": f"Вот контекст: {qdrant_context}"
-                        },
-                        {
-                            "type": "text",
-                            "text": "Примечание, отвечай строго по контексту!!!"
-                        }
-                    ]
-                }
-            ]
+            model=llm_settings.LLM_MODEL,
+            messages=messages
         )
         response = completion.choices[0].message.content
-        return response
-    
+        return response, packed.token_usage()
+
+    async def stream_search_in_llm(
+        self,
+        request: str,
+        chat_id: int,
+        chunks: list[dict],
+        documents: list,
+        is_disconnected: Callable[[], Awaitable[bool]],
+        on_complete: Optional[Callable[[str, dict], None]] = None
+    ) -> AsyncIterator[str]:
+        """SSE-поток ответа: documents (с usage), затем delta по мере генерации, в конце done (или error).
+
+        Ответ сохраняется в историю только после полного завершения потока.
+        """
+        messages, packed = await self._build_messages(request=request, chat_id=chat_id, chunks=chunks)
+
+        async def events() -> AsyncIterator[str]:
+            yield self._sse(
+                {"documents": documents, "usage": packed.token_usage(), "from_cache": False}, event="documents"
+            )
+            deadline = asyncio.get_running_loop().time() + llm_settings.LLM_TIMEOUT
+            parts = []
+            stream = None
+            try:
+                stream = await self.client.chat.completions.create(
+                    extra_headers={},
+                    extra_body={},
+                    model=llm_settings.LLM_MODEL,
+                    messages=messages,
+                    stream=True
+                )
+                async for chunk in stream:
+                    if await is_disconnected():
+                        print(f"[LlmService] Клиент отключился, генерация для чата {chat_id} прервана")
+                        return
+                    if asyncio.get_running_loop().time() > deadline:
+                        raise asyncio.TimeoutError()
+                    delta = chunk.choices[0].delta.content if chunk.choices else None
+                    if delta:
+                        parts.append(delta)
+                        yield self._sse({"delta": delta})
+            except (asyncio.TimeoutError, APITimeoutError):
+                yield self._sse({"detail": "Превышено время ожидания ответа модели"}, event="error")
+                return
+            except APIError as e:
+                yield self._sse({"detail": f"Ошибка модели: {e}"}, event="error")
+                return
+            finally:
+                # Закрываем соединение с моделью и при отключении клиента, и при отмене задачи
+                if stream is not None:
+                    await stream.close()
+
+            response = "".join(parts)
+            request_response = await self.save_request_response(
+                chat_id=chat_id, request=request, response=response, documents=documents
+            )
+            if on_complete is not None:
+                on_complete(response, packed.token_usage())
+            yield self._sse({"id": request_response.id}, event="done")
+
+        return events()
+
+    async def stream_cached_answer(self, request: str, chat_id: int, cached: dict) -> AsyncIterator[str]:
+        """SSE-поток для ответа из кэша: тот же формат, весь ответ одним delta."""
+        async def events() -> AsyncIterator[str]:
+            yield self._sse(
+                {"documents": cached["documents"], "usage": cached["usage"], "from_cache": True}, event="documents"
+            )
+            yield self._sse({"delta": cached["response"]})
+            request_response = await self.save_request_response(
+                chat_id=chat_id, request=request, response=cached["response"], documents=cached["documents"]
+            )
+            yield self._sse({"id": request_response.id}, event="done")
+
+        return events()
+
+    async def save_request_response(self, chat_id: int, request: str, response: str, documents: list) -> RequestResponseOrm:
+        request_response = await self.mysql.add_request_response(
+            chat_id=chat_id, request_content=request, response_content=response, documents=documents
+        )
+        # Название чата — по первому запросу, сразу при записи, а не при каждом чтении списка
+        if request:
+            await self.mysql.set_default_chat_name(chat_id=chat_id, new_name=request)
+        self._schedule_summary_update(chat_id)
+        return request_response
+
+    def _schedule_summary_update(self, chat_id: int):
+        task = self._summary_tasks.get(chat_id)
+        if task is not None and not task.done():
+            return  # уже обновляется; следующий запрос запустит проверку снова
+        task = asyncio.create_task(self._update_summary(chat_id))
+        self._summary_tasks[chat_id] = task
+        task.add_done_callback(lambda _: self._summary_tasks.pop(chat_id, None))
+
+    async def _update_summary(self, chat_id: int):
+        """Сворачивает в сводку запросы, вышедшие за окно последних LLM_HISTORY_TURNS."""
+        try:
+            chat = await self.mysql.get_chat_by_id(chat_id=chat_id)
+            if not chat:
+                return
+            pending = await self.mysql.count_request_responses_after(chat_id=chat_id, after_id=chat.summary_until_id)
+            overflow = pending - llm_settings.LLM_HISTORY_TURNS
+            if overflow < llm_settings.LLM_SUMMARY_BATCH:
+                return
+
+            turns = await self.mysql.get_request_responses_after(
+                chat_id=chat_id, after_id=chat.summary_until_id, limit=overflow
+            )
+            new_turns = self.context_packer.truncate(
+                "\n\n".join(self._get_text_from_chat(turns)), llm_settings.LLM_CONTEXT_BUDGET
+            )
+            completion = await self.client.chat.completions.create(
+                model=llm_settings.LLM_MODEL,
+                max_tokens=llm_settings.LLM_SUMMARY_MAX_TOKENS,
+                messages=[
+                    {"role": "system", "content": SUMMARY_INSTRUCTIONS},
+                    {"role": "user", "content": f"Текущая сводка: {chat.summary or 'нет'}\n\nНовые сообщения:\n{new_turns}"}
+                ]
+            )
+            summary = (completion.choices[0].message.content or "").strip()
+            if not summary:
+                return
+            await self.mysql.update_chat_summary(chat_id=chat_id, summary=summary, summary_until_id=turns[-1].id)
+            print(f"[LlmService] Сводка чата {chat_id} обновлена: +{len(turns)} запросов")
+        except Exception as e:
+            print(f"[LlmService] Не удалось обновить сводку чата {chat_id}: {e}")
+
+    async def _build_messages(self, request: str, chat_id: int, chunks: list[dict]) -> tuple[list[dict], PackedContext]:
+        # Вместо всей истории — сводка и последние запросы, еще не попавшие в нее
+        chat = await self.mysql.get_chat_by_id(chat_id=chat_id)
+        summary_until_id = chat.summary_until_id if chat else None
+        summary = self.context_packer.truncate(chat.summary or "", llm_settings.LLM_SUMMARY_MAX_TOKENS) if chat else ""
+        # Все запросы, еще не свернутые в сводку: пересчет запускается, когда их больше
+        # LLM_HISTORY_TURNS + LLM_SUMMARY_BATCH, так что выборка остается ограниченной
+        recent_history = await self.mysql.get_recent_request_responses(
+            chat_id=chat_id,
+            limit=llm_settings.LLM_HISTORY_TURNS + llm_settings.LLM_SUMMARY_BATCH,
+            after_id=summary_until_id
+        )
+        packed = self.context_packer.pack(
+            question=request,
+            history=self._get_text_from_chat(recent_history),
+            chunks=chunks,
+            reserved_tokens=self.context_packer.count(PROMPT_INSTRUCTIONS) + self.context_packer.count(summary)
+        )
+        print(f"[LlmService] Контекст чата {chat_id}: {packed.total_tokens}/{packed.budget} токенов, "
+              f"отброшено реплик {packed.dropped_turns}, чанков {packed.dropped_chunks}")
+
+        chat_context = "\n\n".join(([f"[SUMMARY] {summary}"] if summary else []) + packed.history)
+        qdrant_context = "\n\n".join(packed.chunks) or "Не найдено релевантной информации."
+        messages = [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "text",
+                        "text": f"Вот мой вопрос: {packed.question}"
+                    },
+                    {
+                        "type": "text",
+                        "text": f"Вот история чата: {chat_context}"
+                    },
+                    {
+                        "type": "text",
+                        "text": f"Вот контекст: {qdrant_context}"
+                    },
+                    {
+                        "type": "text",
+                        "text": PROMPT_INSTRUCTIONS
+                    }
+                ]
+            }
+        ]
+        return messages, packed
+
+    @staticmethod
+    def _sse(data: dict, event: Optional[str] = None) -> str:
+        prefix = f"event: {event}\n" if event else ""
+        return f"{prefix}data: {json.dumps(data, ensure_ascii=False)}\n\n"
 
     @staticmethod
     def _get_text_from_chat(chat_messages: list[RequestResponseOrm]) -> List[str]:
-        """Получает историю сообщений чата по его ID"""
+        """История чата: одна реплика (вопрос и ответ) на элемент, от старых к новым"""
         chat_context = []
         for message in chat_messages:
+            lines = []
             if message.request_content:
-                chat_context.append(f"[REQUEST] {message.request_content}")
+                lines.append(f"[REQUEST] {message.request_content}")
             if message.response_content:
-                chat_context.append(f"[RESPONSE] {message.response_content}")
+                lines.append(f"[RESPONSE] {message.response_content}")
+            if lines:
+                chat_context.append("\n".join(lines))
 
         return chat_context
 
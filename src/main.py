@@ -2,8 +2,8 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from src.core.api import main_router
-from src.core.database import Base, engine
-from src.core.dependencies import get_telegram_service
+from src.core.database import engine
+from src.core.dependencies import get_telegram_service, get_file_util
 
 
 app = FastAPI()
@@ -16,7 +16,18 @@ async def startup_event():
     service = get_telegram_service()
     await service.client.start()        # ← авторизация + подключение
     await service.start_listener()      # ← ВКЛЮЧАЕТ СЛУШАТЕЛЬ СОБЫТИЙ!
+    await service.start_chat_sync()     # ← периодическая синхронизация списка чатов
     print("Telegram listener started")
+    get_file_util().start_sweep()       # ← сборка файлов, на которые не осталось ссылок
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await get_file_util().stop_sweep()
+    service = get_telegram_service()
+    await service.stop_chat_sync()
+    await service.stop_listener()
+    service.transcoder.shutdown()
+    await engine.dispose()
 
 app.add_middleware(
     CORSMiddleware,
@@ -25,7 +36,3 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"]
 )
-
-# Base.metadata.drop_all(engine)
-# Base.metadata.create_all(engine)
-
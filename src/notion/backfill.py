@@ -0,0 +1,27 @@
+"""
+Переиндексирует блоки, добавленные до того, как извлеченный текст
+(extracted_text) стал сохраняться в payload, а документы — разбиваться на чанки.
+
+Запуск: python -m src.notion.backfill
+"""
+import asyncio
+
+from src.core.database import engine, session_factory
+from src.notion.mysql import NotionMysql
+from src.notion.qdrant import NotionQdrant
+
+
+async def backfill() -> None:
+    mysql = NotionMysql(engine=engine, session_factory=session_factory)
+    qdrant = NotionQdrant()
+
+    collections = await mysql.get_all_collections()
+    for collection in collections:
+        updated = await qdrant.reindex_stale_blocks(collection.qdrant_collection_name)
+        print(f"Коллекция {collection.name} ({collection.qdrant_collection_name}): обновлено блоков {updated}")
+
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(backfill())
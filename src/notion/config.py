@@ -0,0 +1,28 @@
+from pydantic_settings import BaseSettings
+
+from dotenv import load_dotenv
+import os
+
+load_dotenv()  # Загрузка переменных из файла .env
+
+class NotionSettings(BaseSettings):
+    # Пакетная векторизация и загрузка точек в Qdrant
+    EMBEDDING_BATCH_SIZE: int = os.getenv("EMBEDDING_BATCH_SIZE", 64)
+    QDRANT_UPSERT_BATCH_SIZE: int = os.getenv("QDRANT_UPSERT_BATCH_SIZE", 256)
+
+    # Параллельный поиск по нескольким коллекциям
+    SEARCH_CONCURRENCY: int = os.getenv("SEARCH_CONCURRENCY", 8)
+    SEARCH_COLLECTION_TIMEOUT: float = os.getenv("SEARCH_COLLECTION_TIMEOUT", 5.0)  # секунды
+
+    # Кэш векторов поисковых запросов
+    EMBEDDING_CACHE_SIZE: int = os.getenv("EMBEDDING_CACHE_SIZE", 1024)
+    EMBEDDING_CACHE_TTL: float = os.getenv("EMBEDDING_CACHE_TTL", 3600)  # секунды
+
+    # Разбиение документов на чанки (в символах)
+    CHUNK_SIZE: int = os.getenv("CHUNK_SIZE", 1000)
+    CHUNK_OVERLAP: int = os.getenv("CHUNK_OVERLAP", 200)
+
+    # Размер страницы при постраничном чтении коллекции
+    COLLECTION_PAGE_SIZE: int = os.getenv("COLLECTION_PAGE_SIZE", 256)
+
+notion_settings = NotionSettings()
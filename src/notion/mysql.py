@@ -8,144 +8,169 @@ class NotionMysql:
         self.engine = engine
         self.session_factory = session_factory
 
-    def add_collection(self, qdrant_collection_name: str, name: str) -> NotionCollectionOrm:
-        with self.session_factory() as session:
+    async def add_collection(self, qdrant_collection_name: str, name: str) -> NotionCollectionOrm:
+        async with self.session_factory() as session:
             collection = NotionCollectionOrm(
                 qdrant_collection_name = qdrant_collection_name,
                 name=name
             )
             session.add(collection)
-            session.commit()
-            session.refresh(collection)
+            await session.commit()
+            await session.refresh(collection)
             return collection
 
-    def delete_collection_by_id(self, collection_id: int) -> bool:
-        with self.session_factory() as session:
-            collection = session.execute(
+    async def delete_collection_by_id(self, collection_id: int) -> bool:
+        async with self.session_factory() as session:
+            collection = (await session.execute(
                 select(NotionCollectionOrm)
                 .where(NotionCollectionOrm.id == collection_id)
-            ).scalar_one_or_none()
+            )).scalar_one_or_none()
 
             if collection:
-                session.delete(collection)
-                session.commit()
+                await session.delete(collection)
+                await session.commit()
                 return True
             return False
 
-    def update_collection_tag_by_id(self, collection_id: int, tag_id: int) -> Optional[NotionCollectionOrm]:
-        with self.session_factory() as session:
+    async def update_collection_tag_by_id(self, collection_id: int, tag_id: int) -> Optional[NotionCollectionOrm]:
+        async with self.session_factory() as session:
             # Обновляем коллекцию
             update_query = (
                 update(NotionCollectionOrm)
                 .where(NotionCollectionOrm.id == collection_id)
                 .values(tag_id=tag_id)
             )
-            session.execute(update_query)
-            session.commit()
+            await session.execute(update_query)
+            await session.commit()
             
             # Получаем обновленную коллекцию
             select_query = (
                 select(NotionCollectionOrm)
                 .where(NotionCollectionOrm.id == collection_id)
             )
-            result = session.execute(select_query)
+            result = await session.execute(select_query)
             return result.scalar_one_or_none()
 
-    def update_collection_name_by_id(self, collection_id: int, name: str) -> Optional[NotionCollectionOrm]:
-        with self.session_factory() as session:
+    async def update_collection_name_by_id(self, collection_id: int, name: str) -> Optional[NotionCollectionOrm]:
+        async with self.session_factory() as session:
             # Обновляем коллекцию
             update_query = (
                 update(NotionCollectionOrm)
                 .where(NotionCollectionOrm.id == collection_id)
                 .values(name=name)
             )
-            session.execute(update_query)
-            session.commit()
+            await session.execute(update_query)
+            await session.commit()
             
             # Получаем обновленную коллекцию
             select_query = (
                 select(NotionCollectionOrm)
                 .where(NotionCollectionOrm.id == collection_id)
             )
-            result = session.execute(select_query)
+            result = await session.execute(select_query)
             return result.scalar_one_or_none()
 
-    def update_collection_order_list_by_id(self, collection_id: int, order_list: list[str]) -> Optional[NotionCollectionOrm]:
-        with self.session_factory() as session:
+    async def update_collection_order_list_by_id(self, collection_id: int, order_list: list[str]) -> Optional[NotionCollectionOrm]:
+        async with self.session_factory() as session:
             # Обновляем коллекцию
             update_query = (
                 update(NotionCollectionOrm)
                 .where(NotionCollectionOrm.id == collection_id)
                 .values(order_list=order_list)
             )
-            session.execute(update_query)
-            session.commit()
+            await session.execute(update_query)
+            await session.commit()
             
             # Получаем обновленную коллекцию
             select_query = (
                 select(NotionCollectionOrm)
                 .where(NotionCollectionOrm.id == collection_id)
             )
-            result = session.execute(select_query)
+            result = await session.execute(select_query)
             return result.scalar_one_or_none()
 
-    def get_collection_by_id(self, collection_id: int) -> NotionCollectionOrm:
-        with self.session_factory() as session:
+    async def append_collection_order_list_by_id(self, collection_id: int, block_ids: list[str]) -> Optional[NotionCollectionOrm]:
+        async with self.session_factory() as session:
+            # Блокируем строку коллекции, чтобы параллельные батчи не потеряли и не задвоили id
+            select_query = (
+                select(NotionCollectionOrm)
+                .where(NotionCollectionOrm.id == collection_id)
+                .with_for_update()
+            )
+            collection = (await session.execute(select_query)).scalar_one_or_none()
+            if collection is None:
+                return None
+
+            # Повтор батча или перезапись существующих блоков не должны задваивать order_list
+            order_list = list(collection.order_list or [])
+            known_ids = {str(block_id) for block_id in order_list}
+            for block_id in block_ids:
+                if str(block_id) not in known_ids:
+                    known_ids.add(str(block_id))
+                    order_list.append(block_id)
+
+            if len(order_list) != len(collection.order_list or []):
+                collection.order_list = order_list
+            await session.commit()
+            return collection
+
+    async def get_collection_by_id(self, collection_id: int) -> NotionCollectionOrm:
+        async with self.session_factory() as session:
             query = (
                 select(NotionCollectionOrm)
                 .where(NotionCollectionOrm.id == collection_id)
             )
-            result = session.execute(query)
+            result = await session.execute(query)
             return result.scalar_one_or_none()    
 
-    def get_all_collections(self) -> list[NotionCollectionOrm]:
-        with self.session_factory() as session:
+    async def get_all_collections(self) -> list[NotionCollectionOrm]:
+        async with self.session_factory() as session:
             query = (
                 select(NotionCollectionOrm)
             )
-            result = session.execute(query)
+            result = await session.execute(query)
             return result.scalars().all()
 
-    def add_tag(self, name: str) -> TagOrm:
-        with self.session_factory() as session:
-            existing_tag = session.execute(
+    async def add_tag(self, name: str) -> TagOrm:
+        async with self.session_factory() as session:
+            existing_tag = (await session.execute(
                 select(TagOrm).where(TagOrm.name == name)
-            ).scalar_one_or_none()
+            )).scalar_one_or_none()
 
             if existing_tag:
                 return existing_tag
 
             tag = TagOrm(name=name)
             session.add(tag)
-            session.commit()
-            session.refresh(tag)
+            await session.commit()
+            await session.refresh(tag)
             return tag
 
-    def get_unique_tags(self) -> list[TagOrm]:
-        with self.session_factory() as session:
+    async def get_unique_tags(self) -> list[TagOrm]:
+        async with self.session_factory() as session:
             query = (
                 select(TagOrm)
             )
-            result = session.execute(query)
+            result = await session.execute(query)
             return result.scalars().all()
         
-    def get_collections_by_tag_id(self, tag_id: int) -> list[NotionCollectionOrm]:
-        with self.session_factory() as session:
+    async def get_collections_by_tag_id(self, tag_id: int) -> list[NotionCollectionOrm]:
+        async with self.session_factory() as session:
             query = (
                 select(NotionCollectionOrm)
                 .where(NotionCollectionOrm.tag_id == tag_id)
             )
-            result = session.execute(query)
+            result = await session.execute(query)
             return result.scalars().all()
 
-    def delete_tag_by_id(self, tag_id: int) -> bool:
-        with self.session_factory() as session:
-            tag = session.execute(
+    async def delete_tag_by_id(self, tag_id: int) -> bool:
+        async with self.session_factory() as session:
+            tag = (await session.execute(
                 select(TagOrm).where(TagOrm.id == tag_id)
-            ).scalar_one_or_none()
+            )).scalar_one_or_none()
 
             if tag:
-                session.delete(tag)
-                session.commit()
+                await session.delete(tag)
+                await session.commit()
                 return True
             return False
@@ -1,13 +1,16 @@
 import uuid
+import heapq
 import asyncio
-from typing import List, Union, Dict, Any
+from typing import List, Union, Dict, Any, Optional, Tuple, AsyncIterator
 
 from qdrant_client import AsyncQdrantClient, models
 from qdrant_client.http.models import Distance, VectorParams, PointStruct
 from sentence_transformers import SentenceTransformer
 
+from src.notion.config import notion_settings
 from src.notion.schemes import AnyBlock, BlockType, TextBlock, HeaderBlock, TableBlock, FileBlock, ListBlock, LinkBlock
 from src.core.utils.file_util import FileUtil
+from src.core.utils.cache_util import TtlLruCache
 from src.core.schemes import MediaType
 
 # Настройки векторизации и Qdrant
@@ -16,6 +19,12 @@ EMBEDDING_VECTOR_SIZE = 384
 QDRANT_HOST = "localhost"
 QDRANT_PORT = 6333
 
+# Ключи payload: текст, извлеченный при добавлении, и связь чанков документа с блоком
+EXTRACTED_TEXT_KEY = "extracted_text"
+PARENT_ID_KEY = "parent_id"
+CHUNK_INDEX_KEY = "chunk_index"
+CHUNK_COUNT_KEY = "chunk_count"
+
 
 class NotionQdrant:
     """Класс для работы с векторной базой данных Qdrant"""
@@ -31,6 +40,12 @@ class NotionQdrant:
         self.model = SentenceTransformer(EMBEDDING_MODEL_NAME, device='cpu')
         print(f"Используется модель для векторизации: {EMBEDDING_MODEL_NAME}")
 
+        # Кэш: нормализованный текст запроса -> вектор
+        self.query_cache = TtlLruCache(
+            maxsize=notion_settings.EMBEDDING_CACHE_SIZE,
+            ttl=notion_settings.EMBEDDING_CACHE_TTL
+        )
+
     # Все остальные методы остаются без изменений...
     async def create_collection(self) -> str:
         """Создает новую коллекцию (заметку)."""
@@ -49,58 +64,191 @@ class NotionQdrant:
 
     async def add_block(self, collection_name: str, block: AnyBlock) -> AnyBlock:
         """Добавляет новый блок в заметку."""
-        text_to_embed = self.extract_text_content(block)
-        vector = await asyncio.to_thread(self.model.encode, text_to_embed)
-        vector = vector.tolist()
-        if block.id == None:
-            block.id = str(uuid.uuid4())
-        payload = self._pydantic_to_payload(block)
-
-        q_block =await self.client.upsert(
-            collection_name=collection_name,
-            points=[
-                PointStruct(
-                    id=block.id,
-                    vector=vector,
-                    payload=payload,
-                )
-            ],
-            wait=True,
+        blocks = await self.add_blocks(collection_name, [block])
+        return blocks[0]
+
+    async def add_blocks(self, collection_name: str, blocks: List[AnyBlock]) -> List[AnyBlock]:
+        """Добавляет пачку блоков: один вызов модели и пакетный upsert."""
+        if not blocks:
+            return []
+
+        for block in blocks:
+            if block.id is None:
+                block.id = str(uuid.uuid4())
+
+        texts = await asyncio.to_thread(lambda: [self.extract_text_content(block) for block in blocks])
+
+        # Документы разбиваются на чанки: родительская точка + дочерние точки с текстом
+        point_specs = []  # (id, текст для векторизации, payload)
+        for block, text in zip(blocks, texts):
+            payload = self._pydantic_to_payload(block)
+            if not self._is_document(block):
+                point_specs.append((block.id, text, {**payload, EXTRACTED_TEXT_KEY: text}))
+                continue
+
+            chunks = FileUtil.split_text(
+                text,
+                chunk_size=notion_settings.CHUNK_SIZE,
+                overlap=notion_settings.CHUNK_OVERLAP
+            )
+            point_specs.append((
+                block.id,
+                block.file_name or "",
+                {**payload, EXTRACTED_TEXT_KEY: "", CHUNK_COUNT_KEY: len(chunks)}
+            ))
+            for index, chunk in enumerate(chunks):
+                point_specs.append((
+                    self._chunk_id(block.id, index),
+                    chunk,
+                    {**payload, EXTRACTED_TEXT_KEY: chunk, PARENT_ID_KEY: block.id, CHUNK_INDEX_KEY: index}
+                ))
+
+        vectors = await asyncio.to_thread(
+            self.model.encode,
+            [text for _, text, _ in point_specs],
+            batch_size=notion_settings.EMBEDDING_BATCH_SIZE
         )
-        
-        print(q_block)
-        return block
+
+        points = [
+            PointStruct(
+                id=point_id,
+                vector=vector.tolist(),
+                payload=payload,
+            )
+            for (point_id, _, payload), vector in zip(point_specs, vectors)
+        ]
+
+        # Старые чанки перезаписываемых документов больше не актуальны
+        document_ids = [block.id for block in blocks if isinstance(block, FileBlock)]
+        if document_ids:
+            await self.client.delete(
+                collection_name=collection_name,
+                points_selector=models.FilterSelector(filter=models.Filter(
+                    must=[models.FieldCondition(key=PARENT_ID_KEY, match=models.MatchAny(any=document_ids))]
+                )),
+                wait=True
+            )
+
+        batch_size = notion_settings.QDRANT_UPSERT_BATCH_SIZE
+        for start in range(0, len(points), batch_size):
+            await self.client.upsert(
+                collection_name=collection_name,
+                points=points[start:start + batch_size],
+                wait=True,
+            )
+
+        print(f"Добавлено блоков в {collection_name}: {len(blocks)} (точек: {len(points)})")
+        return blocks
 
     async def delete_block(self, collection_name: str, block_id: Union[str, int]) -> bool:
-        """Удаляет блок по его ID."""
+        """Удаляет блок по его ID вместе с дочерними чанками."""
         await self.client.delete(
             collection_name=collection_name,
-            points_selector=models.PointIdsList(points=[block_id]),
+            points_selector=models.FilterSelector(filter=models.Filter(
+                should=[
+                    models.HasIdCondition(has_id=[block_id]),
+                    models.FieldCondition(key=PARENT_ID_KEY, match=models.MatchValue(value=str(block_id))),
+                ]
+            )),
             wait=True
         )
         return True
 
 
 
-    async def get_collection_blocks(self, collection_name: str) -> List[Dict[str, Any]]:
-        """Получает все блоки из коллекции в виде сырых данных."""
-        scroll_result = await self.client.scroll(
+    async def get_block(self, collection_name: str, block_id: Union[str, int]) -> Optional[AnyBlock]:
+        """Получает один блок по ID."""
+        points = await self.client.retrieve(
             collection_name=collection_name,
-            limit=10000,
-            with_payload=True,
+            ids=[block_id],
+            with_payload=models.PayloadSelectorExclude(exclude=[EXTRACTED_TEXT_KEY]),
             with_vectors=False
         )
+        if not points:
+            return None
+        block = self.payload_to_pydantic(points[0].payload)
+        block.id = str(points[0].id)
+        return block
 
+    async def get_collection_blocks(self, collection_name: str) -> List[Dict[str, Any]]:
+        """Получает все блоки из коллекции в виде сырых данных (без чанков)."""
         points_data = []
-        for point in scroll_result[0] or []:
-            point_dict = {
-                'id': point.id,
-                'payload': point.payload
-            }
-            points_data.append(point_dict)
-
+        async for page in self.iter_collection_blocks(collection_name):
+            points_data.extend(page)
         return points_data
 
+    async def get_collection_blocks_page(
+            self,
+            collection_name: str,
+            cursor: Optional[Union[str, int]] = None,
+            limit: int = 100
+    ) -> Tuple[List[Dict[str, Any]], Optional[Union[str, int]]]:
+        """Получает одну страницу блоков и курсор следующей страницы."""
+        points, next_offset = await self.client.scroll(
+            collection_name=collection_name,
+            scroll_filter=self._blocks_only_filter(),
+            limit=limit,
+            offset=cursor,
+            with_payload=models.PayloadSelectorExclude(exclude=[EXTRACTED_TEXT_KEY]),
+            with_vectors=False
+        )
+        return [{'id': point.id, 'payload': point.payload} for point in points], next_offset
+
+    async def iter_collection_blocks(
+            self,
+            collection_name: str,
+            page_size: int = None
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Постранично обходит блоки коллекции по offset'ам scroll."""
+        page_size = page_size or notion_settings.COLLECTION_PAGE_SIZE
+        cursor = None
+        while True:
+            page, cursor = await self.get_collection_blocks_page(collection_name, cursor, page_size)
+            if page:
+                yield page
+            if cursor is None:
+                return
+
+    async def reindex_stale_blocks(self, collection_name: str) -> int:
+        """Переиндексирует блоки, сохраненные без текста или документы без чанков."""
+        updated = 0
+        offset = None
+        while True:
+            points, offset = await self.client.scroll(
+                collection_name=collection_name,
+                scroll_filter=self._blocks_only_filter(),
+                limit=notion_settings.QDRANT_UPSERT_BATCH_SIZE,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False
+            )
+            stale_blocks = []
+            for point in points:
+                if self._is_stale_payload(point.payload):
+                    block = self.payload_to_pydantic(point.payload)
+                    block.id = str(point.id)
+                    stale_blocks.append(block)
+            if stale_blocks:
+                await self.add_blocks(collection_name, stale_blocks)
+                updated += len(stale_blocks)
+            if offset is None:
+                return updated
+
+    async def encode_query(self, query_text: str) -> List[float]:
+        """Векторизует текст запроса, повторные запросы берутся из кэша."""
+        normalized = self.normalize_query(query_text)
+        vector = self.query_cache.get(normalized)
+        if vector is None:
+            vector = await asyncio.to_thread(self.model.encode, normalized)
+            vector = vector.tolist()
+            self.query_cache.set(normalized, vector)
+        return vector
+
+    @staticmethod
+    def normalize_query(query_text: str) -> str:
+        """Приводит запрос к каноничному виду (модель uncased, пробелы не важны)."""
+        return " ".join(query_text.split()).lower()
+
     async def search_blocks(
             self,
             query_text: str,
@@ -109,33 +257,70 @@ class NotionQdrant:
             score_threshold: float = 0.3
     ) -> List[dict]:
         """Ищет блоки по текстовому запросу в указанных коллекциях."""
-        query_vector = await asyncio.to_thread(self.model.encode, query_text)
-        query_vector = query_vector.tolist()
+        query_vector = await self.encode_query(query_text)
+
+        semaphore = asyncio.Semaphore(notion_settings.SEARCH_CONCURRENCY)
+        tasks = [
+            self._search_collection(semaphore, collection_name, query_vector, limit, score_threshold)
+            for collection_name in collection_names
+        ]
+        per_collection = await asyncio.gather(*tasks)
 
-        all_results = []
+        # Глобальный top-k по score, а не в порядке коллекций
+        return heapq.nlargest(
+            limit,
+            (result for results in per_collection for result in results),
+            key=lambda result: result['score']
+        )
 
-        for collection_name in collection_names:
+    async def _search_collection(
+            self,
+            semaphore: asyncio.Semaphore,
+            collection_name: str,
+            query_vector: List[float],
+            limit: int,
+            score_threshold: float
+    ) -> List[dict]:
+        """Ищет в одной коллекции с ограничением параллельности и таймаутом."""
+        async with semaphore:
             try:
-                search_result = await self.client.search(
-                    collection_name=collection_name,
-                    query_vector=query_vector,
-                    limit=limit,
-                    with_payload=True,
-                    with_vectors=False
+                search_result = await asyncio.wait_for(
+                    self.client.search(
+                        collection_name=collection_name,
+                        query_vector=query_vector,
+                        limit=limit,
+                        score_threshold=score_threshold,
+                        with_payload=True,
+                        with_vectors=False
+                    ),
+                    timeout=notion_settings.SEARCH_COLLECTION_TIMEOUT
                 )
-
-                for point in search_result:
-                    if point.payload and point.score > score_threshold:
-                        all_results.append({
-                            'payload': point.payload,
-                            'score': point.score,
-                            'collection': collection_name
-                        })
+            except asyncio.TimeoutError:
+                print(f"Таймаут поиска в коллекции {collection_name}")
+                return []
             except Exception as e:
                 print(f"Ошибка поиска в коллекции {collection_name}: {e}")
-                continue
+                return []
+
+        return [
+            {
+                'payload': point.payload,
+                'score': point.score,
+                'collection': collection_name
+            }
+            for point in search_result
+            if point.payload and point.score > score_threshold
+        ]
 
-        return all_results[:limit]
+    @classmethod
+    def get_payload_text(cls, payload: dict) -> str:
+        """Возвращает текст блока, сохраненный при добавлении; файлы заново не разбираются."""
+        if EXTRACTED_TEXT_KEY in payload:
+            return payload[EXTRACTED_TEXT_KEY] or ""
+        block = cls.payload_to_pydantic(payload)
+        if isinstance(block, FileBlock):
+            return ""  # старая точка без текста: нужен python -m src.notion.backfill
+        return cls.extract_text_content(block)
 
     @staticmethod
     def extract_text_content(block: AnyBlock) -> str:
@@ -145,13 +330,37 @@ class NotionQdrant:
 
         if isinstance(block, FileBlock):
             if block.media_type == MediaType.DOCUMENT:
-                file_text = FileUtil().get_file_text(block.file_path)
+                file_text = FileUtil.get_file_text(block.file_path)
                 return file_text
             else:
                 return ""
         else:
             return ""
 
+    @staticmethod
+    def _is_document(block: AnyBlock) -> bool:
+        return isinstance(block, FileBlock) and block.media_type == MediaType.DOCUMENT
+
+    @staticmethod
+    def _is_stale_payload(payload: dict) -> bool:
+        if EXTRACTED_TEXT_KEY not in payload:
+            return True
+        is_document = (payload.get("type") == BlockType.FILE.value
+                       and payload.get("media_type") == MediaType.DOCUMENT.value)
+        return is_document and CHUNK_COUNT_KEY not in payload
+
+    @staticmethod
+    def _chunk_id(block_id: str, index: int) -> str:
+        """Детерминированный id чанка, чтобы повторная загрузка перезаписывала точки."""
+        return str(uuid.uuid5(uuid.NAMESPACE_URL, f"{block_id}:{index}"))
+
+    @staticmethod
+    def _blocks_only_filter() -> models.Filter:
+        """Фильтр логических блоков: точки без parent_id."""
+        return models.Filter(
+            must=[models.IsEmptyCondition(is_empty=models.PayloadField(key=PARENT_ID_KEY))]
+        )
+
     @staticmethod
     def _pydantic_to_payload(block: AnyBlock) -> dict:
         """Конвертирует Pydantic модель в словарь для Qdrant Payload."""
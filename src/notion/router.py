@@ -1,4 +1,5 @@
-from fastapi import APIRouter, HTTPException, Depends, UploadFile
+from fastapi import APIRouter, HTTPException, Depends, UploadFile, Query
+from fastapi.responses import StreamingResponse
 from src.notion.schemes import AnyBlock, FileBlock
 from src.notion.service import NotionService
 from src.core.utils.file_util import FileUtil
@@ -51,11 +52,31 @@ async def delete_tag(tag_id: int, service: NotionService = Depends(get_notion_se
 async def get_all_tags(service: NotionService = Depends(get_notion_service)):
     return await service.get_all_tags()
 
+@router.get("/embeddings/cache/stats")
+async def get_query_cache_stats(service: NotionService = Depends(get_notion_service)):
+    return service.get_query_cache_stats()
+
 @router.get("/collections/{collection_id}")
 async def get_collection_content(collection_id: int, service: NotionService = Depends(get_notion_service)):
     content = await service.get_collection_content(collection_id=collection_id)
     return content
 
+@router.get("/collections/{collection_id}/blocks")
+async def get_collection_content_page(
+    collection_id: int,
+    cursor: str | None = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    service: NotionService = Depends(get_notion_service),
+):
+    return await service.get_collection_content_page(collection_id=collection_id, cursor=cursor, limit=limit)
+
+@router.get("/collections/{collection_id}/blocks:stream")
+async def stream_collection_content(collection_id: int, service: NotionService = Depends(get_notion_service)):
+    lines = await service.stream_collection_content(collection_id=collection_id)
+    if lines is None:
+        raise HTTPException(status_code=404, detail="Collection not found")
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
 @router.post("/collections/{collection_id}/blocks")
 async def add_block_to_collection(
     collection_id: int,
@@ -65,6 +86,15 @@ async def add_block_to_collection(
     block = await service.add_block(collection_id=collection_id, block=block)
     return block
 
+@router.post("/collections/{collection_id}/blocks:batch")
+async def add_blocks_to_collection(
+    collection_id: int,
+    blocks: list[AnyBlock],
+    service: NotionService = Depends(get_notion_service),
+):
+    blocks = await service.add_blocks(collection_id=collection_id, blocks=blocks)
+    return blocks
+
 
 @router.post("/collections/{collection_id}/file")
 async def add_file_block_to_collection(
@@ -75,7 +105,7 @@ async def add_file_block_to_collection(
     file_util: FileUtil = Depends(get_file_util),
     service: NotionService = Depends(get_notion_service),
 ):
-    filename, file_path = file_util.save_file(file=file.file, path="files", filename=file.filename)
+    filename, file_path = await file_util.save_file(file=file.file, filename=file.filename)
     file_block = FileBlock(id=block_id, media_type=media_type, file_name=filename, file_path=file_path)
     block = await service.add_block(collection_id, file_block)
     return block
@@ -1,4 +1,5 @@
-from typing import Dict, Union, List
+import json
+from typing import Dict, Union, List, Optional, AsyncIterator, Callable
 from uuid import UUID
 
 from src.core.database import engine, session_factory
@@ -6,7 +7,7 @@ from src.core.utils.file_util import FileUtil
 from src.notion.models import NotionCollectionOrm, TagOrm
 from src.notion.mysql import NotionMysql
 from src.notion.qdrant import NotionQdrant
-from src.notion.schemes import AnyBlock
+from src.notion.schemes import AnyBlock, BlockType, FileBlock
 
 
 class NotionService:
@@ -16,54 +17,121 @@ class NotionService:
         self.qdrant = NotionQdrant()
         self.mysql = NotionMysql(engine=engine, session_factory=session_factory)
         self.file_util = FileUtil()
+        self.collection_versions: Dict[str, int] = {}  # qdrant_collection_name -> версия содержимого
+        self._change_listeners: List[Callable[[List[str]], None]] = []
+
+    def add_collection_change_listener(self, listener: Callable[[List[str]], None]) -> None:
+        """listener(collection_names) вызывается после каждого изменения блоков коллекций."""
+        self._change_listeners.append(listener)
+
+    def get_collection_versions(self, collection_names: List[str]) -> Dict[str, int]:
+        return {name: self.collection_versions.get(name, 0) for name in collection_names}
+
+    def _mark_collection_changed(self, collection_name: str) -> None:
+        self.collection_versions[collection_name] = self.collection_versions.get(collection_name, 0) + 1
+        for listener in self._change_listeners:
+            listener([collection_name])
+
+    async def encode_query(self, query_text: str) -> List[float]:
+        return await self.qdrant.encode_query(query_text)
 
 
     async def create_collection(self, name: str) -> NotionCollectionOrm:
         qdrant_collection_name = await self.qdrant.create_collection()
-        return self.mysql.add_collection(qdrant_collection_name=qdrant_collection_name, name=name)
+        return await self.mysql.add_collection(qdrant_collection_name=qdrant_collection_name, name=name)
 
     async def delete_collection(self, collection_id: int) -> bool:
-        collection = self.mysql.get_collection_by_id(collection_id=collection_id)
+        collection = await self.mysql.get_collection_by_id(collection_id=collection_id)
+        file_paths = []
+        async for page in self.qdrant.iter_collection_blocks(collection.qdrant_collection_name):
+            file_paths.extend(point["payload"]["file_path"] for point in page
+                              if point["payload"].get("type") == BlockType.FILE.value)
         await self.qdrant.delete_collection(collection.qdrant_collection_name)
-        self.mysql.delete_collection_by_id(collection_id)
+        self._mark_collection_changed(collection.qdrant_collection_name)
+        for file_path in file_paths:
+            await self.file_util.release_file(file_path)
+        await self.mysql.delete_collection_by_id(collection_id)
 
     async def update_collection_tag(self, collection_id: int, tag_id: int) -> None:
-        return self.mysql.update_collection_tag_by_id(collection_id=collection_id, tag_id=tag_id)
+        return await self.mysql.update_collection_tag_by_id(collection_id=collection_id, tag_id=tag_id)
         
     async def update_collection_name(self, collection_id: int, name: str) -> None:
-        return self.mysql.update_collection_name_by_id(collection_id=collection_id, name=name)
+        return await self.mysql.update_collection_name_by_id(collection_id=collection_id, name=name)
         
     async def update_collection_order_list(self, collection_id: int, order_list: list[int]) -> None:
-        return self.mysql.update_collection_order_list_by_id(collection_id=collection_id, order_list=order_list)
+        return await self.mysql.update_collection_order_list_by_id(collection_id=collection_id, order_list=order_list)
 
     async def get_all_collections(self) -> list[NotionCollectionOrm]:
-        return self.mysql.get_all_collections()
+        return await self.mysql.get_all_collections()
 
     async def create_tag(self,name: str) -> TagOrm:
-        return self.mysql.add_tag(name=name)
+        return await self.mysql.add_tag(name=name)
 
     async def get_all_tags(self) -> TagOrm:
-        return self.mysql.get_unique_tags()
+        return await self.mysql.get_unique_tags()
 
     async def delete_tag(self, tag_id: int) -> bool:
-        return self.mysql.delete_tag_by_id(tag_id=tag_id)
+        return await self.mysql.delete_tag_by_id(tag_id=tag_id)
 
     async def add_block(self, collection_id: int, block: AnyBlock) -> AnyBlock:
-        collection = self.mysql.get_collection_by_id(collection_id=collection_id)
-        return await self.qdrant.add_block(collection.qdrant_collection_name, block)
+        blocks = await self._write_blocks(collection_id, [block])
+        return blocks[0]
+
+    async def add_blocks(self, collection_id: int, blocks: List[AnyBlock]) -> List[AnyBlock]:
+        blocks = await self._write_blocks(collection_id, blocks)
+        await self.mysql.append_collection_order_list_by_id(
+            collection_id=collection_id,
+            block_ids=[block.id for block in blocks]
+        )
+        return blocks
+
+    async def _write_blocks(self, collection_id: int, blocks: List[AnyBlock]) -> List[AnyBlock]:
+        """Записывает блоки в Qdrant; ссылку на файл держит каждая точка FileBlock."""
+        collection = await self.mysql.get_collection_by_id(collection_id=collection_id)
+        replaced = await self._get_replaced_file_blocks(collection.qdrant_collection_name, blocks)
+
+        # Ссылки берем до записи: если файла уже нет в хранилище, блок не появится
+        acquired = []
+        try:
+            for block in blocks:
+                if isinstance(block, FileBlock):
+                    await self.file_util.acquire_file(block.file_path)
+                    acquired.append(block.file_path)
+            blocks = await self.qdrant.add_blocks(collection.qdrant_collection_name, blocks)
+        except BaseException:
+            for file_path in acquired:
+                await self.file_util.release_file(file_path)
+            raise
+
+        for block in replaced:
+            await self.file_util.release_file(block.file_path)
+        self._mark_collection_changed(collection.qdrant_collection_name)
+        return blocks
+
+    async def _get_replaced_file_blocks(self, collection_name: str, blocks: List[AnyBlock]) -> List[FileBlock]:
+        """Файловые блоки, которые будут перезаписаны блоками с теми же id."""
+        replaced = []
+        for block in blocks:
+            if block.id is None:
+                continue
+            old_block = await self.qdrant.get_block(collection_name, block.id)
+            if isinstance(old_block, FileBlock):
+                replaced.append(old_block)
+        return replaced
 
     async def delete_block(self, collection_id: int, block_id: Union[str, int]) -> bool:
-        collection = self.mysql.get_collection_by_id(collection_id=collection_id)
-        return await self.qdrant.delete_block(collection.qdrant_collection_name, block_id)
+        collection = await self.mysql.get_collection_by_id(collection_id=collection_id)
+        block = await self.qdrant.get_block(collection.qdrant_collection_name, block_id)
+        deleted = await self.qdrant.delete_block(collection.qdrant_collection_name, block_id)
+        self._mark_collection_changed(collection.qdrant_collection_name)
+        if isinstance(block, FileBlock):
+            await self.file_util.release_file(block.file_path)
+        return deleted
 
     async def get_collection_content(self, collection_id: int) -> List[AnyBlock]:
-        collection = self.mysql.get_collection_by_id(collection_id=collection_id)
+        collection = await self.mysql.get_collection_by_id(collection_id=collection_id)
         point_list = await self.qdrant.get_collection_blocks(collection.qdrant_collection_name)
-        block_list = []
-        for point in point_list:
-            block = self.qdrant.payload_to_pydantic(point.get("payload"))
-            block.id = point.get("id")
-            block_list.append(block)
+        block_list = [self._point_to_block(point) for point in point_list]
         
         # Создаем словарь для быстрого поиска блоков по ID
         block_dict = {block.id: block for block in block_list}
@@ -76,10 +144,46 @@ class NotionService:
         
         return {"content": sorted_blocks, "order_list": collection.order_list}
 
+    async def get_collection_content_page(
+            self,
+            collection_id: int,
+            cursor: Optional[str] = None,
+            limit: int = 100
+    ) -> dict:
+        """Страница блоков коллекции; order_list отдается только с первой страницей."""
+        collection = await self.mysql.get_collection_by_id(collection_id=collection_id)
+        point_list, next_cursor = await self.qdrant.get_collection_blocks_page(
+            collection.qdrant_collection_name, cursor=cursor, limit=limit
+        )
+        return {
+            "content": [self._point_to_block(point) for point in point_list],
+            "next_cursor": next_cursor,
+            "order_list": collection.order_list if cursor is None else None,
+        }
+
+    async def stream_collection_content(self, collection_id: int) -> Optional[AsyncIterator[str]]:
+        """NDJSON-поток: первая строка — order_list, далее по блоку на строку."""
+        collection = await self.mysql.get_collection_by_id(collection_id=collection_id)
+        if not collection:
+            return None
+
+        async def lines() -> AsyncIterator[str]:
+            yield json.dumps({"order_list": collection.order_list}) + "\n"
+            async for page in self.qdrant.iter_collection_blocks(collection.qdrant_collection_name):
+                for point in page:
+                    yield self._point_to_block(point).model_dump_json() + "\n"
+
+        return lines()
+
+    def _point_to_block(self, point: dict) -> AnyBlock:
+        block = self.qdrant.payload_to_pydantic(point.get("payload"))
+        block.id = point.get("id")
+        return block
+
 
     async def search_in_notion(self, query_text: str, collection_names: List[str], limit: int = 500):
         """
-        Возвращает чистый текстовый контекст без метаданных и список документов.
+        Возвращает найденные чанки ({"text", "score"}, по убыванию score) и список документов.
         """
         search_results = await self.qdrant.search_blocks(
             query_text=query_text,
@@ -93,7 +197,7 @@ class NotionService:
         for result in search_results:
             try:
                 block = self.qdrant.payload_to_pydantic(result['payload'])
-                text_content = self.qdrant.extract_text_content(block).strip()
+                text_content = self.qdrant.get_payload_text(result['payload']).strip()
                 
                 # Проверяем, является ли блок документом
                 if hasattr(block, 'media_type') and getattr(block, 'media_type') == 'document':
@@ -109,17 +213,19 @@ class NotionService:
                     
                     
                     # Добавляем информацию о документе в список
-                    if document_info:  # только если есть хотя бы одно поле
+                    # только если есть хотя бы одно поле; чанки одного документа не дублируем
+                    if document_info and document_info not in documents:
                         documents.append(document_info)
                 
                 # Добавляем текстовый контент в общий список (для всех блоков)
                 if text_content:
-                    text_chunks.append(text_content)
+                    text_chunks.append({"text": text_content, "score": result["score"]})
                     
             except Exception:
                 continue
 
-        # Ограничиваем общее количество текстовых чанков
-        text_context = "\n\n".join(text_chunks[:limit]) if text_chunks else "Не найдено релевантной информации."
-        
-        return text_context, documents
\ No newline at end of file
+        # Размер контекста для модели ограничивает ContextPacker по бюджету токенов
+        return text_chunks[:limit], documents
+
+    def get_query_cache_stats(self) -> dict:
+        return self.qdrant.query_cache.stats()
@@ -9,4 +9,53 @@ class TelegramSettings(BaseSettings):
     TG_API_ID: str = os.getenv("TG_API_ID")
     TG_API_HASH: str = os.getenv("TG_API_HASH")
 
-telegram_settings = TelegramSettings()
\ No newline at end of file
+    # Дисковый кэш миниатюр медиа
+    MEDIA_CACHE_MAX_BYTES: int = os.getenv("MEDIA_CACHE_MAX_BYTES", 512 * 1024 * 1024)
+    THUMBNAIL_SIZE: int = os.getenv("THUMBNAIL_SIZE", 512)  # px по большей стороне
+    THUMBNAIL_SOURCE_MAX_BYTES: int = os.getenv("THUMBNAIL_SOURCE_MAX_BYTES", 20 * 1024 * 1024)
+
+    # Параллельная обработка страницы сообщений
+    MESSAGE_HYDRATION_CONCURRENCY: int = os.getenv("MESSAGE_HYDRATION_CONCURRENCY", 10)
+    MESSAGE_HYDRATION_TIMEOUT: float = os.getenv("MESSAGE_HYDRATION_TIMEOUT", 10.0)  # секунды
+
+    # Кэш отправителей сообщений
+    SENDER_CACHE_SIZE: int = os.getenv("SENDER_CACHE_SIZE", 5000)
+    SENDER_CACHE_TTL: float = os.getenv("SENDER_CACHE_TTL", 3600)  # секунды
+
+    # Перекодирование анимаций: gif, webp (дешевле) или mp4 (без перекодирования)
+    TRANSCODE_FORMAT: str = os.getenv("TRANSCODE_FORMAT", "gif")
+    TRANSCODE_WORKERS: int = os.getenv("TRANSCODE_WORKERS", 2)
+    TRANSCODE_QUEUE_SIZE: int = os.getenv("TRANSCODE_QUEUE_SIZE", 8)
+    TRANSCODE_CACHE_MAX_BYTES: int = os.getenv("TRANSCODE_CACHE_MAX_BYTES", 256 * 1024 * 1024)
+
+    # Потоковое скачивание файлов (Telegram принимает запросы не больше 512 КБ)
+    DOWNLOAD_CHUNK_SIZE: int = os.getenv("DOWNLOAD_CHUNK_SIZE", 512 * 1024)
+
+    # Кэш объектов сообщений
+    MESSAGE_CACHE_SIZE: int = os.getenv("MESSAGE_CACHE_SIZE", 2000)
+    MESSAGE_CACHE_TTL: float = os.getenv("MESSAGE_CACHE_TTL", 600)  # секунды
+
+    # Локальное зеркало истории сообщений
+    MIRROR_BATCH_SIZE: int = os.getenv("MIRROR_BATCH_SIZE", 100)
+    MIRROR_CATCHUP_MAX: int = os.getenv("MIRROR_CATCHUP_MAX", 1000)  # больше — зеркало начинается заново
+
+    # Синхронизация списка чатов
+    CHAT_SYNC_INTERVAL: float = os.getenv("CHAT_SYNC_INTERVAL", 300)  # секунды, 0 — без фоновой синхронизации
+    CHAT_SYNC_ICON_CONCURRENCY: int = os.getenv("CHAT_SYNC_ICON_CONCURRENCY", 8)
+
+    # Очередь событий слушателя: по очереди на воркера, чат всегда попадает в одну и ту же
+    LISTENER_WORKERS: int = os.getenv("LISTENER_WORKERS", 4)
+    LISTENER_QUEUE_SIZE: int = os.getenv("LISTENER_QUEUE_SIZE", 256)
+
+    # Отправка по WebSocket: очередь на подключение и таймаут одной отправки
+    WS_SEND_QUEUE_SIZE: int = os.getenv("WS_SEND_QUEUE_SIZE", 100)
+    WS_SEND_TIMEOUT: float = os.getenv("WS_SEND_TIMEOUT", 5.0)
+
+    # Планировщик вызовов Telethon (частоты по методам — DEFAULT_RATES в scheduler.py)
+    TG_SCHEDULER_CONCURRENCY: int = os.getenv("TG_SCHEDULER_CONCURRENCY", 8)
+    TG_DEFAULT_RATE: float = os.getenv("TG_DEFAULT_RATE", 5.0)  # запросов в секунду
+    TG_RATE_BURST: float = os.getenv("TG_RATE_BURST", 5)
+    TG_FLOOD_MAX_WAIT: float = os.getenv("TG_FLOOD_MAX_WAIT", 300)  # дольше — ошибка вместо ожидания
+    TG_FLOOD_RETRIES: int = os.getenv("TG_FLOOD_RETRIES", 3)
+
+telegram_settings = TelegramSettings()
@@ -0,0 +1,76 @@
+import os
+import tempfile
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+
+class MediaCache:
+    """Дисковый кэш миниатюр медиа с вытеснением по размеру (LRU).
+
+    Порядок использования ведется в памяти; mtime файлов нужен только чтобы восстановить его после перезапуска.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+        # ключ -> (имя файла, размер), от давно использованных к свежим;
+        # восстанавливаем индекс по содержимому каталога в порядке mtime
+        self._index: OrderedDict[str, Tuple[str, int]] = OrderedDict()
+        self._total_bytes = 0
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith("."):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+        for _, file_name, size in sorted(entries):
+            self._index[os.path.splitext(file_name)[0]] = (file_name, size)
+            self._total_bytes += size
+
+    def get(self, key: str) -> Optional[str]:
+        """Возвращает путь к закэшированному файлу и отмечает его как использованный."""
+        item = self._index.get(key)
+        if item is None:
+            return None
+        path = os.path.join(self.directory, item[0])
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            self._forget(key)
+            return None
+        self._index.move_to_end(key)
+        return path
+
+    def put(self, key: str, data: bytes, extension: str) -> str:
+        """Атомарно сохраняет файл в кэш и вытесняет самые старые записи."""
+        file_name = f"{key}{extension}"
+        path = os.path.join(self.directory, file_name)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp_")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+        self._forget(key)
+        self._index[key] = (file_name, len(data))
+        self._total_bytes += len(data)
+        self._evict()
+        return path
+
+    def stats(self) -> dict:
+        return {"files": len(self._index), "bytes": self._total_bytes, "max_bytes": self.max_bytes}
+
+    def _forget(self, key: str) -> None:
+        item = self._index.pop(key, None)
+        if item is not None:
+            self._total_bytes -= item[1]
+
+    def _evict(self) -> None:
+        # Вытесняем с начала OrderedDict — без обращений к диску, кроме удаления самих файлов
+        while self._total_bytes > self.max_bytes and self._index:
+            key, (file_name, _) = next(iter(self._index.items()))
+            try:
+                os.unlink(os.path.join(self.directory, file_name))
+            except FileNotFoundError:
+                pass
+            self._forget(key)
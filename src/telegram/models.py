@@ -1,4 +1,4 @@
-from sqlalchemy import Integer, String, ForeignKey, BigInteger
+from sqlalchemy import Integer, String, ForeignKey, BigInteger, Boolean, Text, UniqueConstraint
 from sqlalchemy.orm import Mapped, mapped_column
 from src.core.database import Base
 
@@ -6,9 +6,14 @@ class TelegramChatOrm(Base):
     __tablename__ = "telegram_chat"
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    telegram_chat_id: Mapped[int] = mapped_column(BigInteger)
+    telegram_chat_id: Mapped[int] = mapped_column(BigInteger, unique=True)
     name: Mapped[str] = mapped_column(String(255), nullable=True)
     file_path: Mapped[str] = mapped_column(String(255), nullable=True)
+    icon_photo_id: Mapped[int] = mapped_column(BigInteger, nullable=True)  # photo_id аватара, сохраненного в file_path
+    # Непрерывный диапазон сообщений, сохраненных в telegram_message: [mirror_tail_id, mirror_head_id]
+    mirror_head_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    mirror_tail_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    mirror_complete: Mapped[bool] = mapped_column(Boolean, default=False)  # хвост дошел до начала истории
 
 
 class TelegramCacheOrm(Base):
@@ -20,3 +25,20 @@ class TelegramCacheOrm(Base):
     file_path: Mapped[str] = mapped_column(String(255), nullable=True)
 
 
+class TelegramMessageOrm(Base):
+    __tablename__ = "telegram_message"
+    __table_args__ = (
+        UniqueConstraint("chat_id", "telegram_message_id", name="uq_telegram_message_chat_message"),
+    )
+
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    chat_id: Mapped[int] = mapped_column(Integer, ForeignKey("telegram_chat.id", ondelete="CASCADE"))
+    telegram_message_id: Mapped[int] = mapped_column(BigInteger)
+    text: Mapped[str] = mapped_column(Text, nullable=True)
+    sender_name: Mapped[str] = mapped_column(String(255), nullable=True)
+    sender_id: Mapped[int] = mapped_column(BigInteger, nullable=True)
+    media_type: Mapped[str] = mapped_column(String(32), nullable=True)
+    file_name: Mapped[str] = mapped_column(String(255), nullable=True)
+    photo_url: Mapped[str] = mapped_column(String(512), nullable=True)
+    is_outgoing: Mapped[bool] = mapped_column(Boolean, default=False)
+    is_placeholder: Mapped[bool] = mapped_column(Boolean, default=False)  # гидрация не удалась — перечитать из Telegram
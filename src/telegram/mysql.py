@@ -1,6 +1,10 @@
 from typing import Optional
-from sqlalchemy import select
-from src.telegram.models import TelegramChatOrm, TelegramCacheOrm
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.mysql import insert
+from src.telegram.models import TelegramChatOrm, TelegramCacheOrm, TelegramMessageOrm
+
+
+CHANNEL_ID_BOUND = -1000000000000  # id каналов и супергрупп хранятся как -100..., они всегда меньше
 
 
 class TelegramMysql:
@@ -8,61 +12,188 @@ class TelegramMysql:
         self.engine = engine
         self.session_factory = session_factory
 
-    def add_telegram_chat(self, tg_chat_id: int, name: str, file_path: str) -> TelegramChatOrm:
-        with self.session_factory() as session:
+    async def add_telegram_chat(self, tg_chat_id: int, name: str, file_path: str) -> TelegramChatOrm:
+        async with self.session_factory() as session:
             telegram_chat = TelegramChatOrm(
                 telegram_chat_id=tg_chat_id,
                 name=name,
                 file_path=file_path
             )
             session.add(telegram_chat)
-            session.commit()
-            session.refresh(telegram_chat)
+            await session.commit()
+            await session.refresh(telegram_chat)
             return telegram_chat
 
-    def get_all_chats(self) -> list[TelegramChatOrm]:
-        with self.session_factory() as session:
+    async def upsert_telegram_chats(self, chats: list[dict]) -> None:
+        """Вставляет или обновляет чаты одним запросом по уникальному telegram_chat_id."""
+        if not chats:
+            return
+        async with self.session_factory() as session:
+            query = insert(TelegramChatOrm).values(chats)
+            query = query.on_duplicate_key_update(
+                name=query.inserted.name,
+                file_path=query.inserted.file_path,
+                icon_photo_id=query.inserted.icon_photo_id,
+            )
+            await session.execute(query)
+            await session.commit()
+
+    async def get_all_chats(self) -> list[TelegramChatOrm]:
+        async with self.session_factory() as session:
             query = (
                 select(TelegramChatOrm)
             )
-            result = session.execute(query)
+            result = await session.execute(query)
             return result.scalars().all()
         
-    def get_telegram_chat_by_id(self, chat_id: int) -> TelegramChatOrm:
-        with self.session_factory() as session:
+    async def get_telegram_chat_by_id(self, chat_id: int) -> TelegramChatOrm:
+        async with self.session_factory() as session:
             query = (
                 select(TelegramChatOrm)
                 .where(TelegramChatOrm.id == chat_id)
             )
-            result = session.execute(query)
+            result = await session.execute(query)
             return result.scalar_one_or_none()  
 
-    def add_telegram_cache(self, chat_id: int, telegram_message_id: int, file_path: str = None) -> TelegramCacheOrm:
-        with self.session_factory() as session:
+    async def add_telegram_cache(self, chat_id: int, telegram_message_id: int, file_path: str = None) -> TelegramCacheOrm:
+        async with self.session_factory() as session:
             telegram_cache = TelegramCacheOrm(
                 chat_id=chat_id,
                 telegram_message_id=telegram_message_id,
                 file_path=file_path
             )
             session.add(telegram_cache)
-            session.commit()
-            session.refresh(telegram_cache)
+            await session.commit()
+            await session.refresh(telegram_cache)
             return telegram_cache
 
-    def get_cache_by_telegram_chat_id(self, telegram_chat_id: int) -> list[TelegramCacheOrm]:
-        with self.session_factory() as session:
+    async def get_cache_by_telegram_chat_id(self, telegram_chat_id: int) -> list[TelegramCacheOrm]:
+        async with self.session_factory() as session:
             query = (
                 select(TelegramCacheOrm)
                 .select_from(TelegramCacheOrm)
                 .join(TelegramChatOrm, TelegramCacheOrm.chat_id == TelegramChatOrm.id)
                 .where(TelegramChatOrm.telegram_chat_id == telegram_chat_id)
             )
-            result = session.execute(query)
+            result = await session.execute(query)
             return result.scalars().all()
     
     
-    def get_chat_by_telegram_id(self, tg_chat_id: int) -> Optional[TelegramChatOrm]:
-        with self.session_factory() as session:
-            return session.query(TelegramChatOrm).filter(
-                TelegramChatOrm.telegram_chat_id == tg_chat_id
-            ).first()
\ No newline at end of file
+    async def get_chat_by_telegram_id(self, tg_chat_id: int) -> Optional[TelegramChatOrm]:
+        async with self.session_factory() as session:
+            query = (
+                select(TelegramChatOrm)
+                .where(TelegramChatOrm.telegram_chat_id == tg_chat_id)
+                .limit(1)
+            )
+            result = await session.execute(query)
+            return result.scalars().first()
+
+    async def upsert_messages(self, chat_id: int, messages: list[dict]) -> None:
+        """Сохраняет сообщения зеркала одним INSERT ... ON DUPLICATE KEY UPDATE."""
+        if not messages:
+            return
+        async with self.session_factory() as session:
+            query = insert(TelegramMessageOrm).values([{**message, "chat_id": chat_id} for message in messages])
+            query = query.on_duplicate_key_update(
+                text=query.inserted.text,
+                sender_name=query.inserted.sender_name,
+                sender_id=query.inserted.sender_id,
+                media_type=query.inserted.media_type,
+                file_name=query.inserted.file_name,
+                photo_url=query.inserted.photo_url,
+                is_outgoing=query.inserted.is_outgoing,
+                is_placeholder=query.inserted.is_placeholder,
+            )
+            await session.execute(query)
+            await session.commit()
+
+    async def get_mirrored_messages(
+            self,
+            chat_id: int,
+            limit: int,
+            before_id: Optional[int] = None,
+            min_id: Optional[int] = None
+    ) -> list[TelegramMessageOrm]:
+        """Keyset-страница зеркала: сообщения с id < before_id, от новых к старым."""
+        async with self.session_factory() as session:
+            query = (
+                select(TelegramMessageOrm)
+                .where(TelegramMessageOrm.chat_id == chat_id)
+            )
+            if before_id is not None:
+                query = query.where(TelegramMessageOrm.telegram_message_id < before_id)
+            if min_id is not None:
+                query = query.where(TelegramMessageOrm.telegram_message_id >= min_id)
+            query = query.order_by(TelegramMessageOrm.telegram_message_id.desc()).limit(limit)
+            result = await session.execute(query)
+            return result.scalars().all()
+
+    async def update_mirror_range(
+            self,
+            chat_id: int,
+            head_id: Optional[int] = None,
+            tail_id: Optional[int] = None,
+            complete: Optional[bool] = None
+    ) -> Optional[TelegramChatOrm]:
+        async with self.session_factory() as session:
+            values = {}
+            if head_id is not None:
+                values["mirror_head_id"] = head_id
+            if tail_id is not None:
+                values["mirror_tail_id"] = tail_id
+            if complete is not None:
+                values["mirror_complete"] = complete
+            if values:
+                await session.execute(
+                    update(TelegramChatOrm)
+                    .where(TelegramChatOrm.id == chat_id)
+                    .values(**values)
+                )
+                await session.commit()
+
+            result = await session.execute(
+                select(TelegramChatOrm).where(TelegramChatOrm.id == chat_id)
+            )
+            return result.scalar_one_or_none()
+
+    async def extend_mirror_head(self, chat_id: int, head_id: int) -> None:
+        """Сдвигает голову зеркала вперед (новое сообщение из слушателя)."""
+        async with self.session_factory() as session:
+            await session.execute(
+                update(TelegramChatOrm)
+                .where(TelegramChatOrm.id == chat_id)
+                .values(mirror_head_id=func.greatest(func.coalesce(TelegramChatOrm.mirror_head_id, 0), head_id))
+            )
+            await session.commit()
+
+    async def delete_mirrored_messages(self, message_ids: list[int], tg_chat_id: Optional[int] = None) -> list[int]:
+        """Удаляет сообщения из зеркала и возвращает chat.id затронутых чатов.
+
+        Без tg_chat_id (Telegram не сообщает чат для личных чатов и обычных групп) ищем среди
+        всех чатов, кроме каналов: у них общая нумерация сообщений, id не пересекаются.
+        """
+        if not message_ids:
+            return []
+        async with self.session_factory() as session:
+            query = (
+                select(TelegramMessageOrm.chat_id)
+                .join(TelegramChatOrm, TelegramMessageOrm.chat_id == TelegramChatOrm.id)
+                .where(TelegramMessageOrm.telegram_message_id.in_(message_ids))
+                .distinct()
+            )
+            if tg_chat_id is not None:
+                query = query.where(TelegramChatOrm.telegram_chat_id == tg_chat_id)
+            else:
+                query = query.where(TelegramChatOrm.telegram_chat_id > CHANNEL_ID_BOUND)
+            chat_ids = (await session.execute(query)).scalars().all()
+            if chat_ids:
+                await session.execute(
+                    delete(TelegramMessageOrm)
+                    .where(
+                        TelegramMessageOrm.chat_id.in_(chat_ids),
+                        TelegramMessageOrm.telegram_message_id.in_(message_ids)
+                    )
+                )
+                await session.commit()
+            return list(chat_ids)
@@ -1,4 +1,5 @@
-from fastapi import Depends, APIRouter, Query, Body, WebSocket
+from fastapi import Depends, APIRouter, Query, Body, WebSocket, HTTPException, BackgroundTasks
+from fastapi.responses import FileResponse
 from src.telegram.schemes import MessageSchema, SendMessageSchema
 from src.telegram.service import TelegramService
 from src.core.dependencies import get_telegram_service
@@ -10,6 +11,11 @@ async def get_all_user_chats(service: TelegramService = Depends(get_telegram_ser
     chats = await service.get_all_chats()
     return {"chats": chats}
 
+@router.post("/tg/chats/sync")
+async def sync_user_chats(service: TelegramService = Depends(get_telegram_service)):
+    count = await service.sync_chats()
+    return {"status": "ok", "count": count}
+
 @router.get("/tg/chats/{chat_id}/messages")
 async def get_chat_messages(
     chat_id: int,
@@ -24,6 +30,16 @@ async def get_chat_messages(
     )
     return messages
 
+@router.post("/tg/chats/{chat_id}/backfill")
+async def backfill_chat_history(
+    chat_id: int,
+    background_tasks: BackgroundTasks,
+    max_messages: int = Query(default=1000, ge=1, le=100000),
+    service: TelegramService = Depends(get_telegram_service)
+):
+    background_tasks.add_task(service.backfill_chat_history, chat_id=chat_id, max_messages=max_messages)
+    return {"status": "scheduled"}
+
 @router.post("/tg/{chat_id}/cache/{message_id}")
 async def add_to_cache(
     chat_id: int,
@@ -49,6 +65,38 @@ async def get_message_as_block(
     return await service.get_message_as_block(chat_id=chat_id, message_id=message_id)
 
 
+@router.get("/tg/cache/stats")
+async def get_cache_stats(service: TelegramService = Depends(get_telegram_service)):
+    return service.get_cache_stats()
+
+@router.get("/tg/media/{tg_chat_id}/{message_id}/{media_key}")
+async def get_media_thumbnail(
+    tg_chat_id: int,
+    message_id: int,
+    media_key: str,
+    service: TelegramService = Depends(get_telegram_service)
+):
+    path = await service.get_media_thumbnail(telegram_chat_id=tg_chat_id, message_id=message_id, media_key=media_key)
+    if not path:
+        raise HTTPException(status_code=404, detail="Media not found")
+    # Ключ содержит id и access_hash медиа, поэтому содержимое по URL не меняется
+    return FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+
+
+@router.websocket("/tg/ws")
+async def websocket_chats(
+    websocket: WebSocket,
+    service: TelegramService = Depends(get_telegram_service)
+):
+    # Одно подключение на клиента; чаты выбираются командами subscribe/unsubscribe
+    connection = await service.connect(websocket)
+    try:
+        while True:
+            service.handle_ws_command(connection, await websocket.receive_text())
+    except:
+        pass
+    finally:
+        await service.disconnect(connection)
 
 @router.websocket("/tg/ws/{chat_id}")
 async def websocket_chat(
@@ -56,11 +104,12 @@ async def websocket_chat(
     chat_id: int,
     service: TelegramService = Depends(get_telegram_service)
 ):
-    await service.connect(websocket, chat_id)
+    connection = await service.connect(websocket)
+    service.subscribe(connection, [chat_id])
     try:
         while True:
             await websocket.receive_text()
     except:
         pass
     finally:
-        await service.disconnect(websocket, chat_id)
\ No newline at end of file
+        await service.disconnect(connection)
@@ -0,0 +1,274 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import time
+from contextlib import contextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+
+from telethon import TelegramClient
+from telethon.errors import FloodWaitError
+
+
+# Запросов в секунду на метод; остальные методы получают default_rate
+DEFAULT_RATES = {
+    "get_messages": 3.0,
+    "get_dialogs": 0.5,
+    "get_me": 1.0,
+    "get_sender": 10.0,
+    "send_message": 1.0,
+    "download_media": 5.0,
+    "download_profile_photo": 3.0,
+    "iter_download": 20.0,  # чанков в секунду
+}
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0  # страницы, которые ждет пользователь
+    BACKGROUND = 1   # догрузка истории, синхронизация чатов и аватаров
+
+
+_current_priority: contextvars.ContextVar[Priority] = contextvars.ContextVar(
+    "telegram_priority", default=Priority.INTERACTIVE
+)
+
+
+@contextmanager
+def background_priority():
+    """Все вызовы Telegram внутри блока (и в порожденных задачах) идут фоновой полосой."""
+    token = _current_priority.set(Priority.BACKGROUND)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+class TokenBucket:
+    """Ограничение частоты одного метода; FloodWait ставит метод на паузу целиком.
+
+    Токен достается самому приоритетному ожидающему, при равном приоритете — раньше пришедшему.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self._waiters: list = []
+        self._counter = itertools.count()
+        self._changed = asyncio.Event()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    async def acquire(self, priority: Priority = Priority.INTERACTIVE):
+        entry = (priority, next(self._counter))
+        heapq.heappush(self._waiters, entry)
+        try:
+            while True:
+                if self._waiters[0] is not entry:
+                    # Не первый в очереди — ждем, пока очередь сдвинется
+                    changed = self._changed
+                    await changed.wait()
+                    continue
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    heapq.heappop(self._waiters)
+                    self._notify()
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+        except asyncio.CancelledError:
+            if entry in self._waiters:
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self._notify()
+            raise
+
+    def _notify(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def pause(self, seconds: float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+
+class PriorityGate:
+    """Ограничение одновременных запросов; освободившийся слот получает самый приоритетный ожидающий."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.active = 0
+        self._waiters: list = []
+        self._counter = itertools.count()
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: Priority):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release()  # слот уже передали — возвращаем его
+            raise
+
+    def release(self):
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)  # слот переходит ожидающему, active не меняется
+                return
+        self.active -= 1
+
+
+class TelegramScheduler:
+    """Единая точка вызовов Telethon: лимиты по методам, FloodWait, приоритеты и склейка дублей."""
+
+    def __init__(
+        self,
+        client: TelegramClient,
+        default_rate: float,
+        burst: float,
+        concurrency: int,
+        max_flood_wait: float,
+        max_retries: int,
+        rates: Optional[Dict[str, float]] = None
+    ):
+        self.client = client
+        # FloodWait обрабатываем сами, чтобы притормозить весь метод, а не один запрос
+        self.client.flood_sleep_threshold = 0
+        self.default_rate = default_rate
+        self.burst = burst
+        self.max_flood_wait = max_flood_wait
+        self.max_retries = max_retries
+        self.rates = {**DEFAULT_RATES, **(rates or {})}
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._gate = PriorityGate(concurrency)
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self.stats = {"calls": 0, "coalesced": 0, "flood_waits": 0, "flood_wait_seconds": 0, "failures": 0}
+
+    def _bucket(self, method: str) -> TokenBucket:
+        bucket = self._buckets.get(method)
+        if bucket is None:
+            bucket = TokenBucket(rate=self.rates.get(method, self.default_rate), capacity=self.burst)
+            self._buckets[method] = bucket
+        return bucket
+
+    async def call(
+        self,
+        method: str,
+        func: Callable[..., Awaitable[Any]],
+        *args,
+        coalesce: bool = False,
+        **kwargs
+    ) -> Any:
+        """Выполняет func(*args, **kwargs) под лимитами метода method.
+
+        coalesce=True — одинаковые одновременные вызовы (только чтение!) выполняются один раз.
+        """
+        if not coalesce:
+            return await self._run(method, func, args, kwargs)
+
+        key = (method, repr(args), repr(sorted(kwargs.items())))
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._run(method, func, args, kwargs))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._forget_inflight(key, done))
+        # Отмена одного ожидающего не должна отменять вызов для остальных
+        return await asyncio.shield(task)
+
+    def _forget_inflight(self, key: tuple, task: asyncio.Future):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # ошибку уже получили ожидающие; гасим предупреждение asyncio
+
+    async def _run(self, method: str, func: Callable[..., Awaitable[Any]], args: tuple, kwargs: dict) -> Any:
+        priority = _current_priority.get()
+        bucket = self._bucket(method)
+        for attempt in range(self.max_retries + 1):
+            # Токен ждется до входа в шлюз, чтобы медленный метод не занимал слоты остальных
+            await bucket.acquire(priority)
+            await self._gate.acquire(priority)
+            try:
+                if not self.client.is_connected():
+                    await self.client.connect()
+                self.stats["calls"] += 1
+                return await func(*args, **kwargs)
+            except FloodWaitError as e:
+                self._on_flood_wait(method, bucket, e, attempt)
+            finally:
+                self._gate.release()
+
+    async def stream(
+        self,
+        method: str,
+        factory: Callable[[int], AsyncIterator[bytes]]
+    ) -> AsyncIterator[bytes]:
+        """Потоковое скачивание с лимитом на чанки; после FloodWait продолжает с того же смещения.
+
+        factory(offset) должен вернуть новый итератор чанков, начиная с offset байт.
+        Каждый чанк запрашивается через шлюз со своим приоритетом, слот держится только на время запроса.
+        """
+        priority = _current_priority.get()
+        bucket = self._bucket(method)
+        offset = 0
+        attempt = 0
+        while True:
+            chunks = factory(offset).__aiter__()
+            try:
+                while True:
+                    await bucket.acquire(priority)
+                    await self._gate.acquire(priority)
+                    try:
+                        chunk = await chunks.__anext__()
+                    except StopAsyncIteration:
+                        return
+                    finally:
+                        self._gate.release()
+                    offset += len(chunk)
+                    yield chunk
+            except FloodWaitError as e:
+                self._on_flood_wait(method, bucket, e, attempt)
+                attempt += 1
+
+    def _on_flood_wait(self, method: str, bucket: TokenBucket, error: FloodWaitError, attempt: int):
+        self.stats["flood_waits"] += 1
+        self.stats["flood_wait_seconds"] += error.seconds
+        if error.seconds > self.max_flood_wait or attempt >= self.max_retries:
+            self.stats["failures"] += 1
+            raise error
+        print(f"[TelegramScheduler] FloodWait {error.seconds} с для {method}, повтор {attempt + 1}")
+        bucket.pause(error.seconds)
+
+    def get_stats(self) -> dict:
+        return {
+            **self.stats,
+            "active": self._gate.active,
+            "waiting": self._gate.waiting,
+            "rate_waiting": sum(bucket.waiting for bucket in self._buckets.values()),
+            "inflight_coalesced": len(self._inflight),
+            "paused_methods": sorted(
+                method for method, bucket in self._buckets.items()
+                if bucket.paused_until > time.monotonic()
+            ),
+        }
@@ -14,7 +14,7 @@ class MessageSchema(BaseModel):
     media_type: Optional[MediaType] = None
     file_name: Optional[str] = None
     file_path: Optional[str] = None
-    photo_base64: Optional[str] = None
+    photo_url: Optional[str] = None  # URL миниатюры: /tg/media/{tg_chat_id}/{message_id}/{media_key}
     is_outgoing: bool = False  # ← КЛЮЧЕВОЕ ПОЛЕ
 
 class SendMessageSchema(BaseModel):
@@ -1,35 +1,79 @@
 import io
-import base64
+import asyncio
+import json
 import os
-from typing import BinaryIO, List, Optional, Dict
-import cv2
+from typing import List, Optional, Dict, Set
 from PIL import Image
-import tempfile
-import os
 
 from telethon import TelegramClient, events
 from telethon.tl.types import (
     Message, User, MessageMediaPhoto, MessageMediaDocument, Document,
-    MessageMediaWebPage, PeerUser, PeerChannel, PeerChat
+    MessageMediaWebPage, PeerUser, PeerChannel, PeerChat, UpdateUserName
 )
 from fastapi import WebSocket
 
 from src.core.database import engine, session_factory
 from src.core.schemes import MediaType
 from src.core.utils.file_util import FileUtil
+from src.core.utils.cache_util import TtlLruCache
 from src.notion.schemes import Block, FileBlock, LinkBlock, TextBlock
-from src.telegram.models import TelegramChatOrm
+from src.telegram.config import telegram_settings
+from src.telegram.media_cache import MediaCache
+from src.telegram.models import TelegramChatOrm, TelegramMessageOrm
+from src.telegram.transcoder import IMAGE_EXTENSIONS, Transcoder
 from src.telegram.schemes import MessageSchema
 from src.telegram.mysql import TelegramMysql
+from src.telegram.scheduler import TelegramScheduler, background_priority
+from src.telegram.ws_connection import WebSocketConnection
 
 
 class TelegramService:
     def __init__(self, client: TelegramClient):
         self.client = client
         self.file_util = FileUtil()
+        self.scheduler = TelegramScheduler(
+            client,
+            default_rate=telegram_settings.TG_DEFAULT_RATE,
+            burst=telegram_settings.TG_RATE_BURST,
+            concurrency=telegram_settings.TG_SCHEDULER_CONCURRENCY,
+            max_flood_wait=telegram_settings.TG_FLOOD_MAX_WAIT,
+            max_retries=telegram_settings.TG_FLOOD_RETRIES
+        )
         self.mysql = TelegramMysql(engine=engine, session_factory=session_factory)
-        self.connections: Dict[int, List[WebSocket]] = {}   # ключ — твой внутренний chat.id (например 72)
+        self.connections: Dict[int, Set[WebSocketConnection]] = {}   # внутренний chat.id -> подписанные подключения
+        self.ws_stats = {"queued": 0, "dropped": 0, "evicted": 0}
+        self._close_tasks: Set[asyncio.Task] = set()  # фоновые закрытия вытесненных WebSocket
         self._me = None
+        self._chat_sync_lock = asyncio.Lock()
+        self._chat_sync_task: Optional[asyncio.Task] = None
+        self._live_mirror_heads: set[int] = set()  # чаты, чья голова зеркала догнана в этом процессе
+        self._catching_up_heads: set[int] = set()  # чаты, чья голова догоняется прямо сейчас
+        self._mirrored_chats: set[int] = set()     # чаты, у которых есть зеркало сообщений
+        self._chat_index: Dict[int, int] = {}      # telegram_chat_id -> внутренний chat.id
+        self._event_queues: List[asyncio.Queue] = []
+        self._event_workers: List[asyncio.Task] = []
+        self.listener_stats = {"processed": 0, "skipped": 0, "dropped": 0}
+        self.message_cache = TtlLruCache(  # (telegram_chat_id, message_id) -> Message
+            maxsize=telegram_settings.MESSAGE_CACHE_SIZE,
+            ttl=telegram_settings.MESSAGE_CACHE_TTL
+        )
+        self.sender_cache = TtlLruCache(   # sender_id сообщения -> (sender_name, sender_id)
+            maxsize=telegram_settings.SENDER_CACHE_SIZE,
+            ttl=telegram_settings.SENDER_CACHE_TTL
+        )
+        self.media_cache = MediaCache(
+            directory=os.path.join(self.file_util.storage_path, "thumbs"),
+            max_bytes=telegram_settings.MEDIA_CACHE_MAX_BYTES
+        )
+        self.transcoder = Transcoder(
+            cache=MediaCache(
+                directory=os.path.join(self.file_util.storage_path, "transcoded"),
+                max_bytes=telegram_settings.TRANSCODE_CACHE_MAX_BYTES
+            ),
+            output_format=telegram_settings.TRANSCODE_FORMAT,
+            max_workers=telegram_settings.TRANSCODE_WORKERS,
+            max_queue=telegram_settings.TRANSCODE_QUEUE_SIZE
+        )
 
     async def __aenter__(self):
         if not self.client.is_connected():
@@ -52,73 +96,227 @@ class TelegramService:
             self.handle_edit_message,
             events.MessageEdited(incoming=True, outgoing=True)
         )
+        self.client.add_event_handler(
+            self.handle_delete_message,
+            events.MessageDeleted()
+        )
+        self.client.add_event_handler(
+            self.handle_user_update,
+            events.Raw(types=[UpdateUserName])
+        )
+        self.client.add_event_handler(
+            self.handle_chat_action,
+            events.ChatAction()
+        )
+        await self._refresh_chat_index()
+        self._event_queues = [
+            asyncio.Queue(maxsize=telegram_settings.LISTENER_QUEUE_SIZE)
+            for _ in range(telegram_settings.LISTENER_WORKERS)
+        ]
+        self._event_workers = [asyncio.create_task(self._event_worker(queue)) for queue in self._event_queues]
         print("Telegram listener запущен — приходят ВСЕ сообщения (включая свои)")
 
+    async def stop_listener(self):
+        for task in self._event_workers:
+            task.cancel()
+        await asyncio.gather(*self._event_workers, return_exceptions=True)
+        self._event_workers = []
+        self._event_queues = []
+
     async def handle_new_message(self, event: events.NewMessage.Event):
-        await self._process_telegram_event(event.message, "new_message")
+        self._enqueue_event(event.message, "new_message")
 
     async def handle_edit_message(self, event: events.MessageEdited.Event):
-        await self._process_telegram_event(event.message, "edit_message")
+        # Закэшированная версия сообщения устарела — заменяем свежей
+        self.message_cache.set((event.chat_id, event.message.id), event.message)
+        self._enqueue_event(event.message, "edit_message")
 
-    async def _process_telegram_event(self, message: Message, event_type: str):
+    async def handle_delete_message(self, event: events.MessageDeleted.Event):
+        # Удаленное в Telegram не должно оставаться в зеркале истории
+        chat_ids = await self.mysql.delete_mirrored_messages(event.deleted_ids, tg_chat_id=event.chat_id)
+        for internal_chat_id in chat_ids:
+            await self.broadcast(internal_chat_id, {"type": "delete_message", "message_ids": event.deleted_ids})
+
+    @staticmethod
+    def _get_peer_chat_id(message: Message) -> Optional[int]:
         # Определяем реальный telegram_chat_id
-        tg_chat_id = None
-        if message.peer_id:
-            if isinstance(message.peer_id, PeerUser):
-                tg_chat_id = message.peer_id.user_id
-            elif isinstance(message.peer_id, PeerChannel):
-                tg_chat_id = int(f"-100{message.peer_id.channel_id}")
-            elif isinstance(message.peer_id, PeerChat):
-                tg_chat_id = message.peer_id.chat_id
+        if isinstance(message.peer_id, PeerUser):
+            return message.peer_id.user_id
+        if isinstance(message.peer_id, PeerChannel):
+            return int(f"-100{message.peer_id.channel_id}")
+        if isinstance(message.peer_id, PeerChat):
+            return message.peer_id.chat_id
+        return None
 
+    def _needs_persistence(self, internal_chat_id: int, event_type: str) -> bool:
+        # Новые сообщения нужны зеркалу, только если его голова догнана (иначе их подтянет догрузка),
+        # правки — любому чату, у которого уже есть зеркало
+        if event_type == "new_message":
+            return internal_chat_id in self._live_mirror_heads or internal_chat_id in self._catching_up_heads
+        return internal_chat_id in self._mirrored_chats
+
+    def _enqueue_event(self, message: Message, event_type: str):
+        """Дешевая фильтрация в обработчике Telethon: тяжелая работа — только для нужных событий."""
+        tg_chat_id = self._get_peer_chat_id(message)
         if tg_chat_id is None:
             print(f"[TelegramService] Не удалось определить telegram_chat_id для сообщения {message.id}")
             return
 
-        # Ищем чат по telegram_chat_id (поле в БД!)
-        internal_chat = self.mysql.get_chat_by_telegram_id(tg_chat_id)
-        if not internal_chat:
-            print(f"[TelegramService] Чат с telegram_chat_id={tg_chat_id} не найден в базе")
+        internal_chat_id = self._chat_index.get(tg_chat_id)
+        if internal_chat_id is None:
+            return  # чат еще не синхронизирован в базу
+
+        if internal_chat_id not in self.connections and not self._needs_persistence(internal_chat_id, event_type):
+            self.listener_stats["skipped"] += 1
+            return
+
+        if not self._event_queues:
+            return
+        # Один чат — одна очередь, чтобы правка не обогнала само сообщение
+        queue = self._event_queues[internal_chat_id % len(self._event_queues)]
+        try:
+            queue.put_nowait((internal_chat_id, message, event_type))
+        except asyncio.QueueFull:
+            self.listener_stats["dropped"] += 1
+            # Голову зеркала больше не двигаем: пропущенное подтянет следующее чтение истории
+            self._live_mirror_heads.discard(internal_chat_id)
+            print(f"[TelegramService] Очередь событий переполнена, {event_type} {message.id} пропущено")
+
+    async def _event_worker(self, queue: asyncio.Queue):
+        while True:
+            internal_chat_id, message, event_type = await queue.get()
+            try:
+                await self._process_telegram_event(internal_chat_id, message, event_type)
+                self.listener_stats["processed"] += 1
+            except Exception as e:
+                # Сообщение могло не попасть в зеркало — голову дальше не двигаем, пропуск закроет догрузка
+                self._live_mirror_heads.discard(internal_chat_id)
+                self._catching_up_heads.discard(internal_chat_id)
+                print(f"[TelegramService] Ошибка обработки события {event_type} {message.id}: {e}")
+            finally:
+                queue.task_done()
+
+    async def _process_telegram_event(self, internal_chat_id: int, message: Message, event_type: str):
+        # Пока событие ждало в очереди, подписчики могли уйти
+        persist = self._needs_persistence(internal_chat_id, event_type)
+        if internal_chat_id not in self.connections and not persist:
+            self.listener_stats["skipped"] += 1
             return
 
         schema = await self._to_message_schema(message)
-        await self.broadcast(internal_chat.id, {"type": event_type, "message": schema.dict()})
-        print(f"→ {event_type} отправлено в UI (chat_id={internal_chat.id}, msg_id={message.id}, outgoing={schema.is_outgoing})")
+
+        if persist:
+            await self.mysql.upsert_messages(internal_chat_id, [self._schema_to_row(schema)])
+            # Пока голова догоняется, сообщение только сохраняем: голову выставит догрузка
+            if event_type == "new_message" and internal_chat_id in self._live_mirror_heads:
+                await self.mysql.extend_mirror_head(internal_chat_id, message.id)
+
+        await self.broadcast(internal_chat_id, {"type": event_type, "message": schema.dict()})
+        print(f"→ {event_type} отправлено в UI (chat_id={internal_chat_id}, msg_id={message.id}, outgoing={schema.is_outgoing})")
+
+    async def _refresh_chat_index(self):
+        chats = await self.mysql.get_all_chats()
+        self._chat_index = {chat.telegram_chat_id: chat.id for chat in chats}
+        self._mirrored_chats = {chat.id for chat in chats if chat.mirror_head_id is not None}
 
     async def broadcast(self, internal_chat_id: int, data: dict):
-        if internal_chat_id not in self.connections:
+        subscribers = self.connections.get(internal_chat_id)
+        if not subscribers:
             return
 
-        dead = []
-        for ws in self.connections[internal_chat_id]:
-            try:
-                await ws.send_json(data)
-            except Exception:
-                dead.append(ws)
-
-        for ws in dead:
-            self.connections[internal_chat_id].remove(ws)
-        if not self.connections[internal_chat_id]:
-            del self.connections[internal_chat_id]
+        # Сериализуем один раз; отправкой занимаются писатели подключений
+        payload = json.dumps({**data, "chat_id": internal_chat_id}, separators=(",", ":"), ensure_ascii=False)
+        for connection in list(subscribers):
+            if connection.offer(payload):
+                self.ws_stats["queued"] += 1
+            else:
+                self.ws_stats["dropped"] += 1
+                self._evict_connection(connection)
+                # Закрываем в фоне: медленный клиент может не принять и close-фрейм
+                task = asyncio.create_task(connection.close(code=1013))
+                self._close_tasks.add(task)
+                task.add_done_callback(self._close_tasks.discard)
 
-    async def connect(self, websocket: WebSocket, chat_id: int):
+    async def connect(self, websocket: WebSocket) -> WebSocketConnection:
         await websocket.accept()
-        self.connections.setdefault(chat_id, []).append(websocket)
-        print(f"WebSocket подключён к внутреннему chat_id={chat_id}")
+        connection = WebSocketConnection(
+            websocket,
+            queue_size=telegram_settings.WS_SEND_QUEUE_SIZE,
+            send_timeout=telegram_settings.WS_SEND_TIMEOUT,
+            on_failure=self._evict_connection
+        )
+        connection.start()
+        print("WebSocket подключён")
+        return connection
+
+    async def disconnect(self, connection: WebSocketConnection):
+        self._remove_connection(connection)
+        await connection.close()
+        print("WebSocket отключён")
 
-    async def disconnect(self, websocket: WebSocket, chat_id: int):
-        if chat_id in self.connections and websocket in self.connections[chat_id]:
-            self.connections[chat_id].remove(websocket)
-            if not self.connections[chat_id]:
-                del self.connections[chat_id]
-            print(f"WebSocket отключён от chat_id={chat_id}")
+    def subscribe(self, connection: WebSocketConnection, chat_ids: List[int]):
+        for chat_id in chat_ids:
+            self.connections.setdefault(chat_id, set()).add(connection)
+            connection.chat_ids.add(chat_id)
+
+    def unsubscribe(self, connection: WebSocketConnection, chat_ids: List[int]):
+        for chat_id in chat_ids:
+            subscribers = self.connections.get(chat_id)
+            if subscribers is not None:
+                subscribers.discard(connection)
+                if not subscribers:
+                    del self.connections[chat_id]
+            connection.chat_ids.discard(chat_id)
+
+    def handle_ws_command(self, connection: WebSocketConnection, text: str):
+        """Команды клиента: {"action": "subscribe" | "unsubscribe", "chat_ids": [...]}"""
+        try:
+            command = json.loads(text)
+            action = command.get("action")
+            chat_ids = [int(chat_id) for chat_id in command.get("chat_ids", [])]
+        except (ValueError, TypeError, AttributeError):
+            reply = {"type": "error", "detail": "Некорректная команда"}
+        else:
+            if action == "subscribe":
+                self.subscribe(connection, chat_ids)
+                reply = {"type": "subscribed", "chat_ids": sorted(connection.chat_ids)}
+            elif action == "unsubscribe":
+                self.unsubscribe(connection, chat_ids)
+                reply = {"type": "subscribed", "chat_ids": sorted(connection.chat_ids)}
+            elif action == "ping":
+                reply = {"type": "pong"}
+            else:
+                reply = {"type": "error", "detail": f"Неизвестное действие: {action}"}
+        connection.offer(json.dumps(reply, separators=(",", ":"), ensure_ascii=False))
+
+    def _remove_connection(self, connection: WebSocketConnection):
+        self.unsubscribe(connection, list(connection.chat_ids))
+
+    def _evict_connection(self, connection: WebSocketConnection):
+        if connection.closed:
+            return
+        self._remove_connection(connection)
+        self.ws_stats["evicted"] += 1
+        print("[TelegramService] Медленный WebSocket отключён")
+
+    def get_ws_stats(self) -> dict:
+        connections = {connection for subscribers in self.connections.values() for connection in subscribers}
+        depths = [connection.depth for connection in connections]
+        return {
+            **self.ws_stats,
+            "connections": len(depths),
+            "subscriptions": sum(len(subscribers) for subscribers in self.connections.values()),
+            "queue_depth_total": sum(depths),
+            "queue_depth_max": max(depths, default=0),
+        }
 
     async def get_all_chats(self) -> List[TelegramChatOrm]:
-        chats = self.mysql.get_all_chats()
+        chats = await self.mysql.get_all_chats()
         if chats:
             return chats
-        await self._load_chats_from_telegram()
-        return self.mysql.get_all_chats()
+        # Первый запуск ждет синхронизацию, дальше список обновляет фоновая задача
+        await self.sync_chats()
+        return await self.mysql.get_all_chats()
 
     async def get_messages_from_chat(
         self,
@@ -126,49 +324,249 @@ class TelegramService:
         limit: int = 20,
         offset_id: int = 0
     ) -> List[MessageSchema]:
-        if not self.client.is_connected():
-            await self.client.connect()
-
-        telegram_chat = self.mysql.get_telegram_chat_by_id(chat_id=chat_id)
+        telegram_chat = await self.mysql.get_telegram_chat_by_id(chat_id=chat_id)
         if not telegram_chat:
             return []
 
-        cache_records = self.mysql.get_cache_by_telegram_chat_id(telegram_chat.telegram_chat_id)  # ← ИСПРАВЛЕНО
+        # Голову зеркала догоняем один раз за процесс, дальше ее двигает слушатель
+        if chat_id not in self._live_mirror_heads:
+            telegram_chat = await self._catch_up_mirror_head(telegram_chat, limit)
+
+        before_id = offset_id or None
+        tail_id = telegram_chat.mirror_tail_id
+        # Страница, начинающаяся с хвоста (offset_id = самое старое из выданного), продолжает непрерывный диапазон
+        in_range = before_id is None or tail_id is None or before_id >= tail_id
+        min_id = tail_id if in_range else None
+        rows = await self.mysql.get_mirrored_messages(chat_id, limit=limit, before_id=before_id, min_id=min_id)
+
+        if len(rows) < limit and not telegram_chat.mirror_complete:
+            # В Telegram идем только за пробелом, которого нет в зеркале
+            if in_range:
+                telegram_chat = await self._extend_mirror_tail(telegram_chat, limit - len(rows))
+                min_id = telegram_chat.mirror_tail_id
+            else:
+                # Ниже хвоста непрерывность не гарантирована — догружаем страницу как есть, диапазон не трогаем
+                messages = await self._fetch_history(telegram_chat, limit=limit, offset_id=offset_id)
+                await self._mirror_messages(telegram_chat, messages)
+            rows = await self.mysql.get_mirrored_messages(chat_id, limit=limit, before_id=before_id, min_id=min_id)
+
+        # Заглушки после таймаута гидрации не отдаем как есть — перечитываем их из Telegram
+        if await self._rehydrate_placeholders(telegram_chat, rows):
+            rows = await self.mysql.get_mirrored_messages(chat_id, limit=limit, before_id=before_id, min_id=min_id)
+
+        cache_records = await self.mysql.get_cache_by_telegram_chat_id(telegram_chat.telegram_chat_id)  # ← ИСПРАВЛЕНО
         cache_dict = {c.telegram_message_id: c.file_path for c in cache_records}
 
-        messages = await self.client.get_messages(
-            entity=telegram_chat.telegram_chat_id,  # ← ИСПРАВЛЕНО
-            limit=limit,
-            offset_id=offset_id
+        result = [self._row_to_schema(row, telegram_chat.telegram_chat_id) for row in rows]
+        for schema in result:
+            if schema.id in cache_dict:
+                schema.file_path = cache_dict[schema.id]
+        result.reverse()  # теперь самые новые — внизу
+        return result
+
+    async def backfill_chat_history(self, chat_id: int, max_messages: int) -> int:
+        """Фоновая догрузка истории чата в зеркало страницами по offset_id."""
+        # Фоновая полоса: страницы, которые ждет пользователь, идут в Telegram первыми
+        with background_priority():
+            return await self._backfill_chat_history(chat_id, max_messages)
+
+    async def _backfill_chat_history(self, chat_id: int, max_messages: int) -> int:
+        telegram_chat = await self.mysql.get_telegram_chat_by_id(chat_id=chat_id)
+        if not telegram_chat:
+            return 0
+        if chat_id not in self._live_mirror_heads:
+            telegram_chat = await self._catch_up_mirror_head(telegram_chat, telegram_settings.MIRROR_BATCH_SIZE)
+
+        loaded = 0
+        while loaded < max_messages and not telegram_chat.mirror_complete:
+            tail_before = telegram_chat.mirror_tail_id
+            telegram_chat = await self._extend_mirror_tail(telegram_chat, telegram_settings.MIRROR_BATCH_SIZE)
+            if telegram_chat.mirror_tail_id == tail_before:
+                break
+            loaded += telegram_settings.MIRROR_BATCH_SIZE
+        print(f"[TelegramService] Зеркало чата {chat_id}: хвост={telegram_chat.mirror_tail_id}, полное={telegram_chat.mirror_complete}")
+        return loaded
+
+    # ===================== ЗЕРКАЛО СООБЩЕНИЙ =====================
+
+    async def _catch_up_mirror_head(self, telegram_chat: TelegramChatOrm, limit: int) -> TelegramChatOrm:
+        """Догружает сообщения новее головы зеркала (или первую страницу для пустого зеркала).
+
+        На время догрузки слушатель уже сохраняет новые сообщения чата, поэтому пришедшие
+        между запросом истории и пометкой головы «живой» не теряются.
+        """
+        chat_id = telegram_chat.id
+        self._catching_up_heads.add(chat_id)
+        try:
+            telegram_chat = await self._fetch_mirror_head(telegram_chat, limit)
+            # Если слушатель не смог сохранить сообщение за это время, голова остается не «живой»
+            if chat_id in self._catching_up_heads:
+                self._live_mirror_heads.add(chat_id)
+        finally:
+            self._catching_up_heads.discard(chat_id)
+        self._mirrored_chats.add(chat_id)
+        return telegram_chat
+
+    async def _fetch_mirror_head(self, telegram_chat: TelegramChatOrm, limit: int) -> TelegramChatOrm:
+        head = telegram_chat.mirror_head_id
+        if head is None:
+            messages = await self._fetch_history(telegram_chat, limit=limit)
+            await self._mirror_messages(telegram_chat, messages)
+            telegram_chat = await self.mysql.update_mirror_range(
+                telegram_chat.id,
+                head_id=messages[0].id if messages else 0,
+                tail_id=messages[-1].id if messages else 0,
+                complete=len(messages) < limit
+            )
+        else:
+            batch_size = telegram_settings.MIRROR_BATCH_SIZE
+            newer = []
+            gap_closed = True
+            offset_id = 0
+            while True:
+                batch = await self._fetch_history(telegram_chat, limit=batch_size, offset_id=offset_id, min_id=head)
+                newer.extend(batch)
+                if len(batch) < batch_size:
+                    break
+                if len(newer) >= telegram_settings.MIRROR_CATCHUP_MAX:
+                    gap_closed = False
+                    break
+                offset_id = batch[-1].id
+
+            await self._mirror_messages(telegram_chat, newer)
+            if newer and gap_closed:
+                telegram_chat = await self.mysql.update_mirror_range(telegram_chat.id, head_id=newer[0].id)
+            elif newer:
+                # Пропуск слишком большой — начинаем непрерывный диапазон заново
+                telegram_chat = await self.mysql.update_mirror_range(
+                    telegram_chat.id, head_id=newer[0].id, tail_id=newer[-1].id, complete=False
+                )
+        return telegram_chat
+
+    async def _extend_mirror_tail(self, telegram_chat: TelegramChatOrm, limit: int) -> TelegramChatOrm:
+        """Догружает страницу истории старше хвоста зеркала."""
+        messages = await self._fetch_history(telegram_chat, limit=limit, offset_id=telegram_chat.mirror_tail_id or 0)
+        await self._mirror_messages(telegram_chat, messages)
+        return await self.mysql.update_mirror_range(
+            telegram_chat.id,
+            tail_id=messages[-1].id if messages else None,
+            complete=len(messages) < limit
         )
 
-        result = []
+    async def _fetch_history(
+        self,
+        telegram_chat: TelegramChatOrm,
+        limit: int,
+        offset_id: int = 0,
+        min_id: int = 0
+    ) -> List[Message]:
+        if not self.client.is_connected():
+            await self.client.connect()
+        messages = await self.scheduler.call(
+            "get_messages",
+            self.client.get_messages,
+            entity=telegram_chat.telegram_chat_id,
+            limit=limit,
+            offset_id=offset_id,
+            min_id=min_id,
+            coalesce=True
+        )
         for message in messages:
-            schema = await self._to_message_schema(message)
-            if message.id in cache_dict:
-                schema.file_path = cache_dict[message.id]
-            result.append(schema)
-        result.reverse()  # теперь самые новые — внизу
-        return result
+            self.message_cache.set((telegram_chat.telegram_chat_id, message.id), message)
+        return list(messages)
+
+    async def _mirror_messages(self, telegram_chat: TelegramChatOrm, messages: List[Message]) -> List[MessageSchema]:
+        placeholder_ids: Set[int] = set()
+        schemas = await self._hydrate_messages(messages, placeholder_ids)
+        # Заглушки сохраняем с флагом: строка нужна для непрерывности диапазона, данные перечитаем при чтении
+        await self.mysql.upsert_messages(telegram_chat.id, [
+            self._schema_to_row(schema, is_placeholder=schema.id in placeholder_ids) for schema in schemas
+        ])
+        return schemas
+
+    async def _rehydrate_placeholders(self, telegram_chat: TelegramChatOrm, rows: List[TelegramMessageOrm]) -> bool:
+        """Повторно запрашивает сообщения, сохраненные заглушками. True, если зеркало изменилось."""
+        message_ids = [row.telegram_message_id for row in rows if row.is_placeholder]
+        if not message_ids:
+            return False
+        try:
+            messages = await self.scheduler.call(
+                "get_messages", self.client.get_messages, telegram_chat.telegram_chat_id, ids=message_ids
+            )
+        except Exception as e:
+            print(f"[TelegramService] Не удалось перечитать заглушки чата {telegram_chat.id}: {e!r}")
+            return False
+
+        found = [message for message in messages if message is not None]
+        for message in found:
+            self.message_cache.set((telegram_chat.telegram_chat_id, message.id), message)
+        await self._mirror_messages(telegram_chat, found)
+        # Сообщения, которых больше нет в Telegram, убираем из зеркала
+        missing = [message_id for message_id, message in zip(message_ids, messages) if message is None]
+        if missing:
+            await self.mysql.delete_mirrored_messages(missing, tg_chat_id=telegram_chat.telegram_chat_id)
+        return True
+
+    async def _hydrate_messages(self, messages: List[Message], placeholder_ids: Optional[Set[int]] = None) -> List[MessageSchema]:
+        if not messages:
+            return []
+        if self._me is None:
+            self._me = await self.scheduler.call("get_me", self.client.get_me, coalesce=True)
+        await self._preresolve_senders(messages)
+
+        # Гидрация страницы параллельно; gather сохраняет порядок сообщений
+        semaphore = asyncio.Semaphore(telegram_settings.MESSAGE_HYDRATION_CONCURRENCY)
+        return await asyncio.gather(*(
+            self._to_message_schema_bounded(semaphore, message, placeholder_ids) for message in messages
+        ))
+
+    @staticmethod
+    def _schema_to_row(schema: MessageSchema, is_placeholder: bool = False) -> dict:
+        return {
+            "telegram_message_id": schema.id,
+            "text": schema.text,
+            "sender_name": schema.sender_name,
+            "sender_id": schema.sender_id,
+            "media_type": schema.media_type.value if schema.media_type else None,
+            "file_name": schema.file_name,
+            "photo_url": schema.photo_url,
+            "is_outgoing": schema.is_outgoing,
+            "is_placeholder": is_placeholder,
+        }
+
+    @staticmethod
+    def _row_to_schema(row: TelegramMessageOrm, telegram_chat_id: int) -> MessageSchema:
+        return MessageSchema(
+            id=row.telegram_message_id,
+            tg_chat_id=telegram_chat_id,
+            text=row.text or "",
+            sender_name=row.sender_name or "Unknown",
+            sender_id=row.sender_id,
+            media_type=row.media_type,
+            file_name=row.file_name,
+            photo_url=row.photo_url,
+            file_path=None,
+            is_outgoing=bool(row.is_outgoing),
+        )
 
     async def add_to_cache(self, chat_id: int, message_id: int):
-        telegram_chat = self.mysql.get_telegram_chat_by_id(chat_id=chat_id)
-        file = await self._download_file_by_message_id(telegram_chat.telegram_chat_id, message_id)  # ← ИСПРАВЛЕНО
-        if not file:
+        telegram_chat = await self.mysql.get_telegram_chat_by_id(chat_id=chat_id)
+        saved = await self._save_message_media(telegram_chat.telegram_chat_id, message_id)
+        if not saved:
             return None
 
-        file_name = await self._get_file_name_for_message(telegram_chat.telegram_chat_id, message_id)  # ← ИСПРАВЛЕНО
-        _, file_path = self.file_util.save_file(file=file, path="cache", filename=file_name)
-        self.mysql.add_telegram_cache(chat_id=chat_id, telegram_message_id=message_id, file_path=file_path)
+        _, file_path = saved
+        await self.mysql.add_telegram_cache(chat_id=chat_id, telegram_message_id=message_id, file_path=file_path)
+        await self.file_util.acquire_file(file_path)  # ссылку держит запись кэша
         return file_path
 
     async def send_message(self, chat_id: int, text: str):
         if not self.client.is_connected():
             await self.client.connect()
-        telegram_chat = self.mysql.get_telegram_chat_by_id(chat_id=chat_id)
+        telegram_chat = await self.mysql.get_telegram_chat_by_id(chat_id=chat_id)
         if not telegram_chat:
             raise ValueError("Chat not found")
-        await self.client.send_message(telegram_chat.telegram_chat_id, text)  # ← ИСПРАВЛЕНО
+        await self.scheduler.call("send_message", self.client.send_message, telegram_chat.telegram_chat_id, text)  # ← ИСПРАВЛЕНО
         return {"success": True}
 
 
@@ -177,16 +575,13 @@ class TelegramService:
             await self.client.connect()
         
         # Получаем информацию о чате
-        telegram_chat = self.mysql.get_telegram_chat_by_id(chat_id=chat_id)
+        telegram_chat = await self.mysql.get_telegram_chat_by_id(chat_id=chat_id)
         if not telegram_chat:
             print(f"[get_message_as_block] Чат с ID={chat_id} не найден")
             return None
         
         # Получаем сообщение из Telegram
-        messages = await self.client.get_messages(
-            entity=telegram_chat.telegram_chat_id,
-            ids=message_id
-        )
+        messages = await self._get_message(telegram_chat.telegram_chat_id, message_id)
         
         if not messages:
             print(f"[get_message_as_block] Сообщение с ID={message_id} не найдено в чате {telegram_chat.telegram_chat_id}")
@@ -215,15 +610,12 @@ class TelegramService:
         
         # Обрабатываем файлы (фото, аудио, документы)
         if media_type in [MediaType.PHOTO, MediaType.AUDIO, MediaType.DOCUMENT]:
-            # Скачиваем файл
-            file = await self._download_file_by_message_id(telegram_chat.telegram_chat_id, message_id)
-            if not file:
+            # Скачиваем файл потоком прямо в хранилище
+            saved = await self._save_message_media(telegram_chat.telegram_chat_id, message_id)
+            if not saved:
                 print(f"[get_message_as_block] Не удалось скачать файл для сообщения {message_id}")
                 return None
-            
-            # Сохраняем файл
-            file_name = await self._get_file_name_for_message(telegram_chat.telegram_chat_id, message_id)
-            _, file_path = self.file_util.save_file(file=file, path="files", filename=file_name)
+            file_name, file_path = saved
             
             return FileBlock(
                 media_type=media_type,
@@ -236,25 +628,50 @@ class TelegramService:
 
     # ===================== ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ =====================
 
+    async def _to_message_schema_bounded(
+        self,
+        semaphore: asyncio.Semaphore,
+        message: Message,
+        placeholder_ids: Optional[Set[int]] = None
+    ) -> MessageSchema:
+        """_to_message_schema под семафором и с таймаутом; при ошибке — заглушка (ее id попадает в placeholder_ids)."""
+        async with semaphore:
+            try:
+                return await asyncio.wait_for(
+                    self._to_message_schema(message),
+                    timeout=telegram_settings.MESSAGE_HYDRATION_TIMEOUT
+                )
+            except Exception as e:
+                print(f"[TelegramService] Не удалось обработать сообщение {message.id}: {e!r}")
+                if placeholder_ids is not None:
+                    placeholder_ids.add(message.id)
+                return self._to_placeholder_schema(message)
+
+    def _to_placeholder_schema(self, message: Message) -> MessageSchema:
+        media_info = self._get_media_info(message)
+        return MessageSchema(
+            id=message.id,
+            tg_chat_id=message.chat_id or 0,
+            text=message.text or "",
+            sender_name="Unknown",
+            sender_id=None,
+            media_type=media_info["media_type"],
+            file_name=media_info["file_name"],
+            is_outgoing=bool(message.out),
+        )
+
     async def _to_message_schema(self, message: Message) -> MessageSchema:
         if self._me is None:
-            self._me = await self.client.get_me()
+            self._me = await self.scheduler.call("get_me", self.client.get_me, coalesce=True)
 
-        sender = await message.get_sender()
-        sender_name = "Unknown"
-        sender_id = None
-        if sender:
-            if isinstance(sender, User):
-                sender_name = (sender.first_name or "") + (f" {sender.last_name}" if sender.last_name else "")
-                sender_id = sender.id
-            else:
-                sender_name = getattr(sender, "title", "Unknown")
-                sender_id = getattr(sender, "id", None)
+        sender_name, sender_id = await self._resolve_sender(message)
 
         media_info = self._get_media_info(message)
-        photo_base64 = None
-        if media_info["media_type"] == MediaType.PHOTO:
-            photo_base64 = await self._download_media_to_base64(message)
+        photo_url = None
+        media_key = self._get_media_key(message)
+        if media_info["media_type"] == MediaType.PHOTO and media_key:
+            # Миниатюра скачивается лениво при первом запросе URL и дальше отдается с диска
+            photo_url = f"/tg/media/{message.chat_id}/{message.id}/{media_key}"
 
         is_outgoing = (sender_id is not None and self._me is not None and sender_id == self._me.id)
 
@@ -266,11 +683,56 @@ class TelegramService:
             sender_id=sender_id,
             media_type=media_info["media_type"],
             file_name=media_info["file_name"],
-            photo_base64=photo_base64,
+            photo_url=photo_url,
             file_path=None,
             is_outgoing=is_outgoing,
         )
 
+    async def _resolve_sender(self, message: Message) -> tuple[str, Optional[int]]:
+        """Имя и id отправителя; не больше одного запроса сущности на отправителя."""
+        cached = self.sender_cache.get(message.sender_id) if message.sender_id is not None else None
+        if cached is not None:
+            return cached
+
+        sender = await self.scheduler.call("get_sender", message.get_sender)
+        sender_name = "Unknown"
+        sender_id = None
+        if sender:
+            if isinstance(sender, User):
+                sender_name = (sender.first_name or "") + (f" {sender.last_name}" if sender.last_name else "")
+                sender_id = sender.id
+            else:
+                sender_name = getattr(sender, "title", "Unknown")
+                sender_id = getattr(sender, "id", None)
+
+        if message.sender_id is not None:
+            self.sender_cache.set(message.sender_id, (sender_name, sender_id))
+        return sender_name, sender_id
+
+    async def _preresolve_senders(self, messages: List[Message]) -> None:
+        """Заранее разрешает всех отправителей страницы: по одному сообщению на отправителя."""
+        first_by_sender = {}
+        for message in messages:
+            if message.sender_id is not None and message.sender_id not in self.sender_cache:
+                first_by_sender.setdefault(message.sender_id, message)
+        if not first_by_sender:
+            return
+        results = await asyncio.gather(
+            *(self._resolve_sender(message) for message in first_by_sender.values()),
+            return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                print(f"[TelegramService] Не удалось получить отправителя: {result!r}")
+
+    async def handle_user_update(self, update: UpdateUserName):
+        # Имя пользователя изменилось — сбрасываем закэшированного отправителя
+        self.sender_cache.pop(update.user_id)
+
+    async def handle_chat_action(self, event: events.ChatAction.Event):
+        if event.new_title:
+            self.sender_cache.pop(event.chat_id)
+
     def _get_media_info(self, message: Message) -> dict:
         if not message.media:
             return {"media_type": None, "file_name": None}
@@ -309,11 +771,12 @@ class TelegramService:
                 for attr in document.attributes:
                     if hasattr(attr, 'file_name') and attr.file_name:
                         file_name = attr.file_name
-                        # Если это GIF, исправляем расширение
+                        # Если это GIF, расширение соответствует формату перекодирования
+                        extension = self.transcoder.extension
                         if is_gif and file_name.endswith('.mp4'):
-                            file_name = file_name[:-4] + '.gif'
-                        elif is_gif and not file_name.endswith('.gif'):
-                            file_name += '.gif'
+                            file_name = file_name[:-4] + extension
+                        elif is_gif and not file_name.endswith(extension):
+                            file_name += extension
                         break
                 else:
                     file_name = "unknown_file"
@@ -322,157 +785,283 @@ class TelegramService:
     
     
 
-    async def _download_file_by_message_id(self, telegram_chat_id: int, message_id: int) -> Optional[io.BytesIO]:
+    async def _get_message(self, telegram_chat_id: int, message_id: int) -> Optional[Message]:
+        """Сообщение из кэша; в Telegram идем только при промахе."""
+        key = (telegram_chat_id, message_id)
+        message = self.message_cache.get(key)
+        if message is not None:
+            return message
+
         if not self.client.is_connected():
             await self.client.connect()
-        msg = await self.client.get_messages(telegram_chat_id, ids=message_id)
+        message = await self.scheduler.call(
+            "get_messages", self.client.get_messages, telegram_chat_id, ids=message_id, coalesce=True
+        )
+        if message:
+            self.message_cache.set(key, message)
+        return message
+
+    def get_cache_stats(self) -> dict:
+        return {
+            "messages": self.message_cache.stats(),
+            "senders": self.sender_cache.stats(),
+            "media": self.media_cache.stats(),
+            "websockets": self.get_ws_stats(),
+            "scheduler": self.scheduler.get_stats(),
+            "listener": {
+                **self.listener_stats,
+                "queued": sum(queue.qsize() for queue in self._event_queues),
+            },
+        }
+
+    async def _save_message_media(self, telegram_chat_id: int, message_id: int) -> Optional[tuple[str, str]]:
+        """Скачивает медиа сообщения в хранилище FileUtil. Возвращает (file_name, file_path)."""
+        if not self.client.is_connected():
+            await self.client.connect()
+        msg = await self._get_message(telegram_chat_id, message_id)
         if not msg or not msg.media:
             return None
-        data = await self.client.download_media(msg, file=bytes)
-        data = await self._convert_to_gif_bytes(data)
-        return io.BytesIO(data) if data else None
+        file_name = self._get_media_info(msg)["file_name"] or f"file_{message_id}"
 
-    async def _download_media_to_base64(self, message: Message) -> Optional[str]:
-        if not message.media:
+        # Этот файл уже скачивали — ни трафика, ни места на диске
+        is_gif = self._is_gif(msg)
+        source_key = self._get_media_key(msg)
+        if source_key and is_gif:
+            source_key = f"{source_key}_{self.transcoder.output_format}"
+        if source_key:
+            file_path = await self.file_util.find_by_source(source_key)
+            if file_path:
+                return file_name, file_path
+
+        # Анимации перекодируются целиком в памяти (они небольшие), PDF/аудио и прочее отдаются как есть
+        if is_gif:
+            data = await self.scheduler.call("download_media", self.client.download_media, msg, file=bytes)
+            if not data:
+                return None
+            data, extension = await self.transcoder.transcode(msg.media.document.id, data)
+            file_name = os.path.splitext(file_name)[0] + extension
+            # Исходный MP4 вместо перекодированного файла под ключом формата не регистрируем,
+            # иначе следующий запрос так и не получит перекодированную версию
+            if extension != self.transcoder.extension:
+                source_key = None
+            _, file_path = await self.file_util.save_file(io.BytesIO(data), filename=file_name, source_key=source_key)
+            return file_name, file_path
+
+        # Остальное пишется потоком: в памяти не больше одного чанка
+        chunks = self.scheduler.stream("iter_download", lambda offset: self.client.iter_download(
+            msg.media,
+            offset=offset,
+            chunk_size=telegram_settings.DOWNLOAD_CHUNK_SIZE,
+            request_size=telegram_settings.DOWNLOAD_CHUNK_SIZE
+        ))
+        _, file_path = await self.file_util.save_stream(chunks, filename=file_name, source_key=source_key)
+        return file_name, file_path
+
+    async def get_media_thumbnail(self, telegram_chat_id: int, message_id: int, media_key: str) -> Optional[str]:
+        """Возвращает путь к миниатюре медиа, скачивая ее только при промахе кэша."""
+        path = self.media_cache.get(media_key)
+        if path:
+            return path
+
+        if not self.client.is_connected():
+            await self.client.connect()
+        message = await self._get_message(telegram_chat_id, message_id)
+        if not message or self._get_media_key(message) != media_key:
             return None
-        try:
-            data = await self.client.download_media(message.media, file=bytes)
+
+        # Миниатюра рисуется в <img>: анимацию отдаем, только если перекодировщик выдает картинку,
+        # иначе (MP4) — статичное превью Telegram
+        is_gif = self._is_gif(message)
+        animate = is_gif and self.transcoder.extension in IMAGE_EXTENSIONS
+        # Большие изображения-документы не качаем целиком: берем готовое превью Telegram
+        document = getattr(message.media, 'document', None)
+        too_big = (document is not None and not is_gif
+                   and (document.size or 0) > telegram_settings.THUMBNAIL_SOURCE_MAX_BYTES)
+        data = await self._download_thumbnail_source(message, use_thumb=too_big or (is_gif and not animate))
+        if not data:
+            return None
+
+        if animate:
+            animated, extension = await self.transcoder.transcode(message.media.document.id, data)
+            if extension in IMAGE_EXTENSIONS:
+                return self.media_cache.put(media_key, animated, extension)
+            # Перекодирование не удалось (вернулся исходный MP4) — берем статичное превью
+            data = await self._download_thumbnail_source(message, use_thumb=True)
             if not data:
                 return None
-            
-            # Проверяем, является ли медиа GIF'ом
-            is_gif = False
-            if hasattr(message.media, 'document'):
-                if hasattr(message.media.document, 'attributes'):
-                    for attr in message.media.document.attributes:
-                        attr_name = str(attr.__class__.__name__)
-                        if 'Animated' in attr_name or 'Gif' in attr_name:
-                            is_gif = True
-                            break
-            
-            # Если это GIF, конвертируем в правильный формат
-            if is_gif:
-                data = await self._convert_to_gif_bytes(data)
-            
-            return base64.b64encode(data).decode("utf-8") if data else None
+
+        data, extension = await asyncio.to_thread(self._make_thumbnail, data)
+        return self.media_cache.put(media_key, data, extension)
+
+    async def _download_thumbnail_source(self, message: Message, use_thumb: bool) -> Optional[bytes]:
+        try:
+            return await self.scheduler.call(
+                "download_media", self.client.download_media,
+                message.media, file=bytes, thumb=-1 if use_thumb else None, coalesce=True
+            )
         except Exception as e:
             print(f"Error downloading media: {e}")
             return None
 
-    async def _convert_to_gif_bytes(self, video_bytes: bytes) -> bytes:
-        """
-        Конвертирует видео-байты в GIF байты.
-        """
+    @staticmethod
+    def _make_thumbnail(data: bytes) -> tuple[bytes, str]:
+        """Уменьшает изображение до THUMBNAIL_SIZE; непонятный формат кэшируется как есть."""
         try:
-            import asyncio
-            loop = asyncio.get_event_loop()
-            return await loop.run_in_executor(
-                None, 
-                self._mp4_to_gif_bytes_opencv, 
-                video_bytes
-            )
+            image = Image.open(io.BytesIO(data))
+            image.thumbnail((telegram_settings.THUMBNAIL_SIZE, telegram_settings.THUMBNAIL_SIZE))
+            buffer = io.BytesIO()
+            if image.mode in ("RGBA", "LA", "P"):
+                image.save(buffer, format="PNG", optimize=True)
+                return buffer.getvalue(), ".png"
+            image.convert("RGB").save(buffer, format="JPEG", quality=85)
+            return buffer.getvalue(), ".jpg"
         except Exception as e:
-            print(f"Error converting to GIF: {e}")
-            return video_bytes  # Возвращаем оригинальные байты в случае ошибки
+            print(f"Error creating thumbnail: {e}")
+            return data, ".bin"
 
-    def _mp4_to_gif_bytes_opencv(self, mp4_bytes: bytes, fps: int = 10, max_frames: int = 50, scale: float = 0.5) -> bytes:
-        """
-        Конвертация MP4 в GIF с использованием OpenCV.
-        """
-        try:
-            # Создаем временный MP4 файл
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.mp4') as temp_mp4:
-                temp_mp4.write(mp4_bytes)
-                temp_mp4_path = temp_mp4.name
-            
-            try:
-                # Читаем видео с помощью OpenCV
-                cap = cv2.VideoCapture(temp_mp4_path)
-                if not cap.isOpened():
-                    return mp4_bytes
-                
-                frames = []
-                frame_count = 0
-                
-                while frame_count < max_frames:
-                    ret, frame = cap.read()
-                    if not ret:
-                        break
-                    
-                    # Конвертируем BGR (OpenCV) в RGB (Pillow)
-                    frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                    pil_image = Image.fromarray(frame_rgb)
-                    
-                    # Уменьшаем размер для оптимизации
-                    if scale != 1.0:
-                        new_width = int(pil_image.width * scale)
-                        new_height = int(pil_image.height * scale)
-                        pil_image = pil_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
-                    
-                    frames.append(pil_image)
-                    frame_count += 1
-                
-                cap.release()
-                
-                # Сохраняем в GIF
-                if frames:
-                    gif_buffer = io.BytesIO()
-                    frames[0].save(
-                        gif_buffer,
-                        format='GIF',
-                        save_all=True,
-                        append_images=frames[1:],
-                        duration=1000 // fps,
-                        loop=0,
-                        optimize=True
-                    )
-                    return gif_buffer.getvalue()
-                else:
-                    return mp4_bytes
-                    
-            finally:
-                # Удаляем временный файл
+    @staticmethod
+    def _get_media_key(message: Message) -> Optional[str]:
+        """Ключ кэша медиа: id и access_hash фото/документа Telegram."""
+        media = message.media
+        if isinstance(media, MessageMediaPhoto) and media.photo:
+            return f"photo_{media.photo.id}_{media.photo.access_hash}"
+        if isinstance(media, MessageMediaDocument) and isinstance(media.document, Document):
+            return f"doc_{media.document.id}_{media.document.access_hash}"
+        return None
+
+    @staticmethod
+    def _is_gif(message: Message) -> bool:
+        if hasattr(message.media, 'document') and hasattr(message.media.document, 'attributes'):
+            for attr in message.media.document.attributes:
+                attr_name = str(attr.__class__.__name__)
+                if 'Animated' in attr_name or 'Gif' in attr_name:
+                    return True
+        return False
+
+    async def sync_chats(self) -> int:
+        """Синхронизирует список диалогов с таблицей чатов. Возвращает число чатов."""
+        async with self._chat_sync_lock:
+            if not self.client.is_connected():
+                await self.client.connect()
+            dialogs = [
+                dialog for dialog in await self.scheduler.call("get_dialogs", self.client.get_dialogs, coalesce=True)
+                if dialog.is_user or dialog.is_group or dialog.is_channel
+            ]
+            existing = {chat.telegram_chat_id: chat for chat in await self.mysql.get_all_chats()}
+
+            # Аватары качаем параллельно; неизменившиеся (тот же photo_id) не трогаем
+            semaphore = asyncio.Semaphore(telegram_settings.CHAT_SYNC_ICON_CONCURRENCY)
+            results = await asyncio.gather(*(
+                self._sync_chat_row(semaphore, dialog, existing.get(dialog.id)) for dialog in dialogs
+            ))
+            rows = [row for row, _ in results]
+            await self.mysql.upsert_telegram_chats(rows)
+
+            # Ссылку на аватар держит строка чата: меняем ссылки только после записи строк
+            for row, old_file_path in results:
+                if row["file_path"] == old_file_path:
+                    continue
                 try:
-                    os.unlink(temp_mp4_path)
-                except:
-                    pass
-                    
-        except Exception as e:
-            print(f"Error in OpenCV GIF conversion: {e}")
-            return mp4_bytes
-    
-    async def _get_file_name_for_message(self, telegram_chat_id: int, message_id: int) -> str:
-        if not self.client.is_connected():
-            await self.client.connect()
-        msg = await self.client.get_messages(telegram_chat_id, ids=message_id)
-        if msg and msg.media:
-            info = self._get_media_info(msg)
-            return info["file_name"] or f"file_{message_id}"
-        return f"file_{message_id}"
+                    if row["file_path"]:
+                        await self.file_util.acquire_file(row["file_path"])
+                    if old_file_path:
+                        await self.file_util.release_file(old_file_path)
+                except Exception as e:
+                    print(f"[TelegramService] Не удалось обновить ссылку на аватар чата {row['telegram_chat_id']}: {e}")
 
-    async def _load_chats_from_telegram(self):
-        if not self.client.is_connected():
-            await self.client.connect()
-        dialogs = await self.client.get_dialogs()
-        for dialog in dialogs:
-            if dialog.is_user or dialog.is_group or dialog.is_channel:
-                file = await self._download_chat_icon(dialog)
-                file_path = None
-                if file:
-                    _, file_path = self.file_util.save_file(file, path="icons", filename=f"chat_icon_{dialog.id}.jpg")
-                self.mysql.add_telegram_chat(
-                    tg_chat_id=dialog.id,
-                    name=dialog.name,
-                    file_path=file_path
-                )
+            await self._refresh_chat_index()
+            return len(rows)
+
+    async def _sync_chat_row(
+        self,
+        semaphore: asyncio.Semaphore,
+        dialog,
+        chat: Optional[TelegramChatOrm]
+    ) -> tuple[dict, Optional[str]]:
+        """Строка для upsert и прежний file_path чата (для переноса ссылки на аватар)."""
+        entity = dialog.entity
+        photo = getattr(entity, "photo", None)
+        photo_id = getattr(photo, "photo_id", None)
+        old_file_path = chat.file_path if chat else None
+        icon_photo_id = photo_id
 
-    async def _download_chat_icon(self, dialog) -> Optional[BinaryIO]:
+        if chat and chat.icon_photo_id == photo_id and (chat.file_path or not photo_id):
+            file_path = chat.file_path
+        else:
+            try:
+                async with semaphore:
+                    file_path = await self._download_chat_icon(dialog)
+            except Exception as e:
+                # Временная ошибка не должна стирать рабочий аватар: оставляем прежний,
+                # а старый icon_photo_id заставит повторить загрузку при следующей синхронизации
+                print(f"[TelegramService] Не удалось скачать аватар чата {dialog.id}: {e}")
+                file_path = old_file_path
+                icon_photo_id = chat.icon_photo_id if chat else None
+
+        return {
+            "telegram_chat_id": dialog.id,
+            "name": dialog.name,
+            "file_path": file_path,
+            "icon_photo_id": icon_photo_id if file_path else None,
+        }, old_file_path
+
+    async def start_chat_sync(self) -> None:
+        interval = float(telegram_settings.CHAT_SYNC_INTERVAL)
+        if interval <= 0 or self._chat_sync_task is not None:
+            return
+        self._chat_sync_task = asyncio.create_task(self._chat_sync_loop(interval))
+
+    async def stop_chat_sync(self) -> None:
+        if self._chat_sync_task is None:
+            return
+        self._chat_sync_task.cancel()
         try:
-            entity = dialog.entity
-            if hasattr(entity, "photo") and entity.photo:
-                data = await self.client.download_profile_photo(entity, file=bytes)
-                if data:
-                    return io.BytesIO(data)
-        except Exception:
+            await self._chat_sync_task
+        except asyncio.CancelledError:
             pass
-        return None
\ No newline at end of file
+        self._chat_sync_task = None
+
+    async def _chat_sync_loop(self, interval: float) -> None:
+        while True:
+            try:
+                with background_priority():
+                    count = await self.sync_chats()
+                print(f"[TelegramService] Синхронизировано чатов: {count}")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[TelegramService] Ошибка синхронизации чатов: {e}")
+            await asyncio.sleep(interval)
+
+    async def _download_chat_icon(self, dialog) -> Optional[str]:
+        """Скачивает аватар чата во временный файл хранилища и атомарно переносит его.
+
+        None — у чата нет аватара; ошибка загрузки пробрасывается вызывающему.
+        """
+        entity = dialog.entity
+        if not (hasattr(entity, "photo") and entity.photo):
+            return None
+
+        photo_id = getattr(entity.photo, "photo_id", None)
+        source_key = f"icon_{photo_id}" if photo_id else None
+        if source_key:
+            file_path = await self.file_util.find_by_source(source_key)
+            if file_path:
+                return file_path
+
+        tmp_path = self.file_util.make_temp_path(suffix=".jpg")
+        written_path = None
+        try:
+            written_path = await self.scheduler.call(
+                "download_profile_photo", self.client.download_profile_photo, entity, file=tmp_path
+            )
+            if written_path:
+                _, file_path = await self.file_util.commit_temp_file(
+                    written_path, filename=f"chat_icon_{dialog.id}.jpg", source_key=source_key
+                )
+                return file_path
+            return None
+        finally:
+            for path in {tmp_path, written_path}:
+                if path and os.path.exists(path):
+                    os.unlink(path)
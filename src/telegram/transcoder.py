@@ -0,0 +1,153 @@
+import io
+import os
+import asyncio
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import cv2
+from PIL import Image
+
+from src.telegram.media_cache import MediaCache
+
+
+# Поддерживаемые форматы вывода анимаций
+OUTPUT_EXTENSIONS = {
+    "gif": ".gif",
+    "webp": ".webp",
+    "mp4": ".mp4",  # без перекодирования, исходный файл как есть
+}
+
+# Форматы, которые браузер покажет в <img>
+IMAGE_EXTENSIONS = {".gif", ".webp"}
+
+# tmpfs, если есть: OpenCV читает видео только по пути, а так файл остается в памяти
+_TEMP_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+def transcode_animation(
+        mp4_bytes: bytes,
+        output_format: str,
+        fps: int = 10,
+        max_frames: int = 50,
+        scale: float = 0.5
+) -> Optional[bytes]:
+    """
+    Перекодирует MP4-анимацию в GIF или анимированный WebP.
+    Выполняется в отдельном процессе, поэтому функция на уровне модуля.
+    """
+    with tempfile.NamedTemporaryFile(suffix='.mp4', dir=_TEMP_DIR) as temp_mp4:
+        temp_mp4.write(mp4_bytes)
+        temp_mp4.flush()
+
+        cap = cv2.VideoCapture(temp_mp4.name)
+        if not cap.isOpened():
+            return None
+
+        frames = []
+        try:
+            while len(frames) < max_frames:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+
+                # Уменьшаем средствами OpenCV (INTER_AREA), это заметно дешевле LANCZOS в PIL
+                if scale != 1.0:
+                    frame = cv2.resize(frame, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+                # Конвертируем BGR (OpenCV) в RGB (Pillow)
+                frames.append(Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)))
+        finally:
+            cap.release()
+
+    if not frames:
+        return None
+
+    buffer = io.BytesIO()
+    if output_format == "webp":
+        frames[0].save(
+            buffer,
+            format='WEBP',
+            save_all=True,
+            append_images=frames[1:],
+            duration=1000 // fps,
+            loop=0,
+            quality=70,
+            method=0
+        )
+    else:
+        frames[0].save(
+            buffer,
+            format='GIF',
+            save_all=True,
+            append_images=frames[1:],
+            duration=1000 // fps,
+            loop=0,
+            optimize=True
+        )
+    return buffer.getvalue()
+
+
+class Transcoder:
+    """Перекодирование анимаций в пуле процессов с ограниченной очередью и дисковым кэшем."""
+
+    def __init__(self, cache: MediaCache, output_format: str = "gif", max_workers: int = 2, max_queue: int = 8):
+        if output_format not in OUTPUT_EXTENSIONS:
+            raise ValueError(f"Unknown transcode format: {output_format}")
+        self.cache = cache
+        self.output_format = output_format
+        self.max_workers = max_workers
+        self._slots = asyncio.Semaphore(max_queue)
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    @property
+    def extension(self) -> str:
+        return OUTPUT_EXTENSIONS[self.output_format]
+
+    async def transcode(self, document_id: int, data: bytes) -> tuple[bytes, str]:
+        """Возвращает (данные, расширение); при любой проблеме — исходный MP4."""
+        if self.output_format == "mp4":
+            return data, ".mp4"
+
+        key = f"anim_{document_id}_{self.output_format}"
+        cached_path = self.cache.get(key)
+        if cached_path:
+            return await asyncio.to_thread(self._read_file, cached_path), self.extension
+
+        # Очередь заполнена — не копим задачи, отдаем оригинал
+        if self._slots.locked():
+            print(f"[Transcoder] Очередь переполнена, документ {document_id} отдается без перекодирования")
+            return data, ".mp4"
+
+        async with self._slots:
+            try:
+                loop = asyncio.get_running_loop()
+                result = await loop.run_in_executor(
+                    self._get_executor(),
+                    transcode_animation,
+                    data,
+                    self.output_format
+                )
+            except Exception as e:
+                print(f"Error converting animation: {e}")
+                result = None
+
+        if not result:
+            return data, ".mp4"
+        self.cache.put(key, result, self.extension)
+        return result, self.extension
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    @staticmethod
+    def _read_file(path: str) -> bytes:
+        with open(path, "rb") as f:
+            return f.read()
@@ -0,0 +1,65 @@
+import asyncio
+from typing import Callable, Optional, Set
+
+from fastapi import WebSocket
+
+
+class WebSocketConnection:
+    """WebSocket-подключение с собственной ограниченной очередью отправки и задачей-писателем."""
+
+    def __init__(
+        self,
+        websocket: WebSocket,
+        queue_size: int,
+        send_timeout: float,
+        on_failure: Callable[["WebSocketConnection"], None]
+    ):
+        self.websocket = websocket
+        self.send_timeout = send_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.closed = False
+        self.sent = 0
+        self.chat_ids: Set[int] = set()  # чаты, на которые подписано подключение
+        self._on_failure = on_failure
+        self._writer: Optional[asyncio.Task] = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write_loop())
+
+    def offer(self, payload: str) -> bool:
+        """Ставит уже сериализованное сообщение в очередь. False — очередь переполнена."""
+        if self.closed:
+            return False
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            return False
+
+    @property
+    def depth(self) -> int:
+        return self.queue.qsize()
+
+    async def close(self, code: int = 1000):
+        if self.closed:
+            return
+        self.closed = True
+        if self._writer and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+        try:
+            await asyncio.wait_for(self.websocket.close(code=code), timeout=self.send_timeout)
+        except Exception:
+            pass  # в том числе таймаут: зависшее подключение просто бросаем
+
+    async def _write_loop(self):
+        try:
+            while True:
+                payload = await self.queue.get()
+                await asyncio.wait_for(self.websocket.send_text(payload), timeout=self.send_timeout)
+                self.sent += 1
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Медленный или отвалившийся клиент — отключаем, чтобы не тормозил остальных
+            self._on_failure(self)
+            await self.close(code=1011)
@@ -1,8 +1,12 @@
+const CHATS_PAGE_SIZE = 200; // как limit по умолчанию у GET /llm/chats
+
 export class LlmExplorer {
     constructor(apiBaseUrl, llmViewer) {
         this.api = apiBaseUrl;
         this.viewer = llmViewer;
         this.chats = [];
+        this.hasMoreChats = true;
+        this.loadingChats = false;
         this.popup = null;
         this.backdrop = null;
         this.init();
@@ -15,10 +19,29 @@ export class LlmExplorer {
     }
 
     async loadChats() {
+        this.chats = [];
+        this.hasMoreChats = true;
+        await this.loadMoreChats();
+    }
+
+    // Следующая страница чатов: список отдается от новых к старым, продолжаем с id последнего
+    async loadMoreChats() {
+        if (this.loadingChats || !this.hasMoreChats) return;
+        this.loadingChats = true;
         try {
-            const res = await fetch(`${this.api}/llm/chats`);
-            this.chats = res.ok ? await res.json() : [];
-        } catch (e) { this.chats = []; }
+            const params = new URLSearchParams({ limit: CHATS_PAGE_SIZE });
+            const last = this.chats[this.chats.length - 1];
+            if (last) params.set('before_id', last.id);
+            const res = await fetch(`${this.api}/llm/chats?${params}`);
+            const page = res.ok ? await res.json() : [];
+            this.chats.push(...page.filter(c => !this.chats.some(known => known.id === c.id)));
+            this.hasMoreChats = res.ok && page.length === CHATS_PAGE_SIZE;
+        } catch (e) {
+            this.hasMoreChats = false;
+        } finally {
+            this.loadingChats = false;
+        }
+        this.renderHistoryPopup();
     }
 
     async createChat() {
@@ -45,6 +68,10 @@ export class LlmExplorer {
         this.closePopup();
         this.createBackdrop();
         this.popup = this.createPopup('history-popup', 'История чатов');
+        const body = this.popup.querySelector('.llm-popup-body');
+        body.addEventListener('scroll', () => {
+            if (body.scrollTop + body.clientHeight >= body.scrollHeight - 50) this.loadMoreChats();
+        });
         this.renderHistoryPopup();
     }
 
@@ -62,6 +89,8 @@ export class LlmExplorer {
                     </button>
                 </div>
             `).join('');
+        // Список не заполнил окно — прокрутки не будет, догружаем сразу
+        if (this.hasMoreChats && body.scrollHeight <= body.clientHeight) this.loadMoreChats();
     }
 
     async deleteChat(id) {
@@ -128,13 +128,18 @@ export class LlmViewer {
     addMessage(content, role, docs = []) {
         const div = document.createElement('div');
         div.className = `llm-message ${role}-msg`;
+        this.renderMessage(div, content, docs);
+        this.pageEl.appendChild(div);
+        this.pageEl.scrollTop = this.pageEl.scrollHeight;
+        return div;
+    }
+
+    renderMessage(div, content, docs = []) {
         div.innerHTML = (content || '').replace(/\*\*(.*?)\*\*/g, '<strong>$1</strong>').replace(/\n/g, '<br>');
         if (docs.length) {
             div.innerHTML += `<div class="message-sources"><strong>Источники:</strong> ` +
                 docs.map(d => `<a href="${d.file_path}" target="_blank">${d.file_name}</a>`).join(' • ') + `</div>`;
         }
-        this.pageEl.appendChild(div);
-        this.pageEl.scrollTop = this.pageEl.scrollHeight;
     }
 
     async sendMessage() {
@@ -161,16 +166,43 @@ export class LlmViewer {
         this.pageEl.scrollTop = this.pageEl.scrollHeight;
         // ←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←←
 
-        try {
-            const res = await fetch(`${this.api}/llm/chats/${this.currentChatId}/search?request=${encodeURIComponent(text)}`);
-            const data = await res.json();
+        // Ответ приходит по SSE кусками: показываем его по мере генерации
+        const url = `${this.api}/llm/chats/${this.currentChatId}/search/stream?request=${encodeURIComponent(text)}`;
+        const source = new EventSource(url);
+        let answer = '';
+        let documents = [];
+        let answerDiv = null;
 
-            thinkingDiv.remove();                                                   // убираем анимацию
-            this.addMessage(data.response || 'No response from the model', 'assistant', data.documents || []);
-        } catch (e) {
+        const finish = (fallback) => {
+            source.close();
             thinkingDiv.remove();
-            this.addMessage('Error: could not get a response', 'assistant');
-        }
+            if (answerDiv) {
+                this.renderMessage(answerDiv, answer || fallback, documents);
+            } else {
+                this.addMessage(answer || fallback, 'assistant', documents);
+            }
+            this.pageEl.scrollTop = this.pageEl.scrollHeight;
+        };
+
+        source.addEventListener('documents', (e) => {
+            documents = JSON.parse(e.data).documents || [];
+        });
+        source.onmessage = (e) => {
+            answer += JSON.parse(e.data).delta || '';
+            if (!answerDiv) {
+                thinkingDiv.remove();
+                answerDiv = this.addMessage(answer, 'assistant');
+            } else {
+                this.renderMessage(answerDiv, answer);
+                this.pageEl.scrollTop = this.pageEl.scrollHeight;
+            }
+        };
+        source.addEventListener('done', () => finish('No response from the model'));
+        source.addEventListener('error', (e) => {
+            // Событие error шлет и сервер (с данными), и сам EventSource при обрыве соединения
+            const detail = e.data ? JSON.parse(e.data).detail : null;
+            finish(`Error: ${detail || 'could not get a response'}`);
+        });
     }
 
     async loadCurrentContext() {
@@ -14,12 +14,26 @@ export class TelegramViewer {
     }
 
     loadChat(chatId) {
+        chatId = Number(chatId);  // из data-атрибута приходит строка, а в событиях — число
+        const previousChatId = this.currentChatId;
         this.currentChatId = chatId;
         this.messagesContainer.innerHTML = '';
         this.oldestMessageId = null;
         this.hasMore = true;
         this.loadMessages();
+
+        // Одно подключение на все чаты: меняем только подписку
+        if (previousChatId !== null && previousChatId !== chatId) {
+            this.sendWsCommand('unsubscribe', [previousChatId]);
+        }
         this.connectWebSocket();
+        this.sendWsCommand('subscribe', [chatId]);
+    }
+
+    sendWsCommand(action, chatIds) {
+        if (this.websocket && this.websocket.readyState === WebSocket.OPEN) {
+            this.websocket.send(JSON.stringify({ action, chat_ids: chatIds }));
+        }
     }
 
     async loadMessages() {
@@ -70,7 +84,7 @@ export class TelegramViewer {
             div.dataset.messageId = msg.id;
 
             const hasText = msg.text && msg.text.trim().length > 0;
-            const hasPhoto = msg.media_type === 'photo' && (msg.photo_base64 || msg.file_path);
+            const hasPhoto = msg.media_type === 'photo' && (msg.photo_url || msg.file_path);
 
             if (hasPhoto && !hasText) {
                 div.classList.add('photo-only');
@@ -98,9 +112,9 @@ export class TelegramViewer {
     renderMediaContent(msg) {
         let html = '';
         
-        if (msg.media_type === 'photo' && msg.photo_base64) {
+        if (msg.media_type === 'photo' && msg.photo_url) {
             html += `<div class="media-container photo-container">
-                <img src="data:image/jpeg;base64,${msg.photo_base64}" class="media-photo" alt="Photo">
+                <img src="${this.apiBaseUrl}${msg.photo_url}" class="media-photo" alt="Photo" loading="lazy">
             </div>`;
         }
         else if (msg.media_type === 'audio' && msg.file_path) {
@@ -132,7 +146,7 @@ export class TelegramViewer {
                 </div>`;
             }
         }
-        else if (msg.media_type && !msg.file_path && !msg.photo_base64) {
+        else if (msg.media_type && !msg.file_path && !msg.photo_url) {
             let icon = 'fa-file';
             let text = 'File';
             switch(msg.media_type) {
@@ -215,15 +229,26 @@ export class TelegramViewer {
     }
 
     connectWebSocket() {
-        if (this.websocket) this.websocket.close();
+        if (this.websocket && this.websocket.readyState <= WebSocket.OPEN) return;
 
-        const wsUrl = this.apiBaseUrl.replace('http', 'ws') + `/tg/ws/${this.currentChatId}`;
+        const wsUrl = this.apiBaseUrl.replace('http', 'ws') + '/tg/ws';
         this.websocket = new WebSocket(wsUrl);
 
-        this.websocket.onopen = () => console.log("WebSocket connected:", wsUrl);
+        this.websocket.onopen = () => {
+            console.log("WebSocket connected:", wsUrl);
+            if (this.currentChatId !== null) this.sendWsCommand('subscribe', [this.currentChatId]);
+        };
 
         this.websocket.onmessage = (e) => {
             const data = JSON.parse(e.data);
+            if (data.chat_id !== undefined && data.chat_id !== this.currentChatId) return;
+            if (data.type === 'delete_message') {
+                for (const id of data.message_ids) {
+                    const el = this.messagesContainer.querySelector(`.message[data-message-id="${id}"]`);
+                    if (el) el.remove();
+                }
+                return;
+            }
             if (data.type === 'new_message') {
                 const msg = data.message;
 